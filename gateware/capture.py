@@ -0,0 +1,173 @@
+# This file is Copyright (c) 2026 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+from migen import *
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect.csr import *
+
+from litedram.frontend.fifo import LiteDRAMFIFO
+
+from litepcie.common import phy_layout as tlp_description
+
+from gateware.filter import TLPHeader, TLPMatcher
+
+# Modes
+capture_continuous   = 0 # buffer the TLPs while there is room, drop the others
+capture_stop_on_full = 1 # buffer the TLPs from start until the buffer is full
+capture_trigger      = 2 # as stop_on_full, starting from the first TLP matching the trigger
+
+
+class TLPCapture(Module, AutoCSR):
+    def __init__(self, write_port, read_port, base, depth, max_tlp_beats=514):
+        self.sink = sink = stream.Endpoint(tlp_description(64))
+        self.source = source = stream.Endpoint(tlp_description(64))
+
+        self.enable   = CSRStorage()
+        self.mode     = CSRStorage(2)
+        self.drain    = CSRStorage(reset=1)
+        self.start    = CSR()
+        self.stop     = CSR()
+        self.running   = CSRStatus()
+        self.triggered = CSRStatus()
+        self.done      = CSRStatus()
+        self.level     = CSRStatus(32)
+        self.captured  = CSRStatus(32)
+        self.dropped   = CSRStatus(32)
+
+        # # #
+
+        # TLPs are buffered in a ring of depth DRAM words at base, one 64-bit beat (with its be
+        # and last) per DRAM word. A TLP is only buffered when there is room for a TLP of
+        # max_tlp_beats (4 dwords header + 4096 bytes payload) so that the DRAM FIFO never stalls
+        # the PHY in the middle of a TLP. When disabled, the TLPs bypass the buffer. (LiteDRAMFIFO
+        # base/depth are in bytes).
+        assert write_port.data_width >= 64 + 8 + 1
+        self.submodules.fifo = fifo = LiteDRAMFIFO(
+            data_width = write_port.data_width,
+            base       = base*write_port.data_width//8,
+            depth      = depth*write_port.data_width//8,
+            write_port = write_port,
+            read_port  = read_port)
+
+        bypass = Signal()
+        level  = Signal(max=depth + 1)
+        room   = Signal()
+        self.sync += level.eq(level +
+            (fifo.sink.valid & fifo.sink.ready) -
+            (fifo.source.valid & fifo.source.ready))
+        self.comb += [
+            room.eq(level <= (depth - max_tlp_beats)),
+            self.level.status.eq(level)
+        ]
+
+        # Buffer --> Source
+        self.comb += If(~bypass & self.drain.storage,
+            source.valid.eq(fifo.source.valid),
+            source.dat.eq(fifo.source.data[0:64]),
+            source.be.eq(fifo.source.data[64:72]),
+            source.last.eq(fifo.source.data[72]),
+            fifo.source.ready.eq(source.ready)
+        )
+
+        # The action is decided when the second beat of the TLP is presented (as TLPFilter).
+        beat0_dat = Signal(64)
+        beat0_be  = Signal(8)
+        self.submodules.header = header = TLPHeader(beat0_dat, sink.dat)
+        self.submodules.trigger = trigger = TLPMatcher(header)
+
+        mode    = self.mode.storage
+        running = self.running.status
+        decide  = Signal()
+        wanted  = Signal()
+        accept  = Signal()
+        self.comb += [
+            If(mode == capture_continuous,
+                wanted.eq(1)
+            ).Elif(mode == capture_stop_on_full,
+                wanted.eq(running)
+            ).Else(
+                wanted.eq(running & (self.triggered.status | trigger.match))
+            ),
+            accept.eq(wanted & room),
+            trigger.count.eq(decide)
+        ]
+        self.sync += [
+            If(self.start.re,
+                running.eq(1),
+                self.triggered.status.eq(0),
+                self.done.status.eq(0)
+            ).Elif(self.stop.re,
+                running.eq(0)
+            ).Elif(decide & wanted,
+                If(mode == capture_trigger,
+                    self.triggered.status.eq(1)
+                ),
+                If(~room & (mode != capture_continuous),
+                    running.eq(0),
+                    self.done.status.eq(1)
+                )
+            ),
+            If(decide,
+                If(accept,
+                    self.captured.status.eq(self.captured.status + 1)
+                ).Elif(wanted,
+                    self.dropped.status.eq(self.dropped.status + 1)
+                )
+            )
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="HEADER")
+        self.comb += bypass.eq(fsm.ongoing("BYPASS") |
+            (fsm.ongoing("HEADER") & ~self.enable.storage & (level == 0)))
+        fsm.act("HEADER",
+            If(self.enable.storage,
+                sink.ready.eq(1),
+                If(sink.valid,
+                    NextValue(beat0_dat, sink.dat),
+                    NextValue(beat0_be, sink.be),
+                    NextState("DECIDE")
+                )
+            # bypass once the buffered TLPs are drained.
+            ).Elif(level == 0,
+                sink.connect(source),
+                If(sink.valid & sink.ready & ~sink.last,
+                    NextState("BYPASS")
+                )
+            )
+        )
+        fsm.act("BYPASS",
+            sink.connect(source),
+            If(sink.valid & sink.ready & sink.last,
+                NextState("HEADER")
+            )
+        )
+        fsm.act("DECIDE",
+            If(sink.valid,
+                If(accept,
+                    fifo.sink.valid.eq(1),
+                    fifo.sink.data.eq(Cat(beat0_dat, beat0_be, 0)),
+                    If(fifo.sink.ready,
+                        decide.eq(1),
+                        NextState("COPY")
+                    )
+                ).Else(
+                    decide.eq(1),
+                    NextState("DROP")
+                )
+            )
+        )
+        fsm.act("COPY",
+            fifo.sink.valid.eq(sink.valid),
+            fifo.sink.data.eq(Cat(sink.dat, sink.be, sink.last)),
+            sink.ready.eq(fifo.sink.ready),
+            If(sink.valid & sink.ready & sink.last,
+                NextState("HEADER")
+            )
+        )
+        fsm.act("DROP",
+            sink.ready.eq(1),
+            If(sink.valid & sink.last,
+                NextState("HEADER")
+            )
+        )
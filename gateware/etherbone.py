@@ -223,7 +223,7 @@ class EtherbonePacket(Module):
     def __init__(self, usb_core, identifier):
         self.submodules.tx = tx = EtherbonePacketTX(identifier)
         self.submodules.rx = rx = EtherbonePacketRX()
-        usb_port = usb_core.crossbar.get_port(identifier)
+        usb_port = usb_core.crossbar.get_port(identifier, dw=32)
         self.comb += [
             tx.source.connect(usb_port.sink),
             usb_port.source.connect(rx.sink)
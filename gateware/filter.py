@@ -0,0 +1,160 @@
+# This file is Copyright (c) 2026 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+from migen import *
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect.csr import *
+
+from litepcie.common import phy_layout as tlp_description
+
+# Actions
+filter_pass  = 0
+filter_drop  = 1
+filter_count = 2 # count the match and continue with the next rules
+
+
+class TLPHeader(Module):
+    def __init__(self, beat0, beat1):
+        # Header fields of a TLP from its first (dw0/dw1) and second (dw2/dw3) beats
+        # (requester_id/tag are in dw2 for completions, the address is in dw3 for 4 dwords
+        # headers).
+        self.fmt_type     = fmt_type     = Signal(7)
+        self.completion   = completion   = Signal()
+        self.requester_id = requester_id = Signal(16)
+        self.tag          = tag          = Signal(8)
+        self.address      = address      = Signal(32)
+
+        # # #
+
+        dw0 = beat0[0:32]
+        dw1 = beat0[32:64]
+        dw2 = beat1[0:32]
+        dw3 = beat1[32:64]
+        self.comb += [
+            fmt_type.eq(dw0[24:31]),
+            completion.eq(fmt_type[1:5] == 0b0101),
+            requester_id.eq(Mux(completion, dw2[16:32], dw1[16:32])),
+            tag.eq(Mux(completion, dw2[8:16], dw1[8:16])),
+            address.eq(Mux(fmt_type[5], dw3, dw2) & 0xfffffffc)
+        ]
+
+
+class TLPMatcher(Module, AutoCSR):
+    def __init__(self, header):
+        # once enabled, the reset values match all TLPs.
+        self.enable            = CSRStorage()
+        self.fmt_type          = CSRStorage(7)
+        self.fmt_type_mask     = CSRStorage(7)
+        self.requester_id      = CSRStorage(16)
+        self.requester_id_mask = CSRStorage(16)
+        self.tag               = CSRStorage(8)
+        self.tag_mask          = CSRStorage(8)
+        self.address_min       = CSRStorage(32)
+        self.address_max       = CSRStorage(32, reset=0xffffffff)
+        self.matches           = CSRStatus(32)
+
+        self.match = Signal()
+        self.count = Signal()
+
+        # # #
+
+        fmt_type     = header.fmt_type
+        requester_id = header.requester_id
+        tag          = header.tag
+        address      = header.address
+        self.comb += self.match.eq(self.enable.storage &
+            ((fmt_type & self.fmt_type_mask.storage) == (self.fmt_type.storage & self.fmt_type_mask.storage)) &
+            ((requester_id & self.requester_id_mask.storage) == (self.requester_id.storage & self.requester_id_mask.storage)) &
+            ((tag & self.tag_mask.storage) == (self.tag.storage & self.tag_mask.storage)) &
+            (address >= self.address_min.storage) &
+            (address <= self.address_max.storage))
+        self.sync += If(self.count & self.match, self.matches.status.eq(self.matches.status + 1))
+
+
+class TLPFilterRule(TLPMatcher):
+    def __init__(self, header):
+        self.action = CSRStorage(2)
+        TLPMatcher.__init__(self, header)
+
+
+class TLPFilter(Module, AutoCSR):
+    def __init__(self, nrules=4):
+        self.sink = sink = stream.Endpoint(tlp_description(64))
+        self.source = source = stream.Endpoint(tlp_description(64))
+
+        self.default_action = CSRStorage(2)
+        self.passed         = CSRStatus(32)
+        self.dropped        = CSRStatus(32)
+
+        # # #
+
+        # The first beat of the TLP (dw0/dw1) is stored and the action is decided when the
+        # second beat (dw2/dw3) is presented: 1 cycle of overhead per TLP. TLPs from the PHY are
+        # at least 2 beats (3 dwords header).
+        beat0_dat = Signal(64)
+        beat0_be  = Signal(8)
+        self.submodules.header = header = TLPHeader(beat0_dat, sink.dat)
+
+        decide = Signal()
+        action = Signal(2)
+        self.rules = []
+        for i in range(nrules):
+            rule = TLPFilterRule(header)
+            setattr(self.submodules, "rule" + str(i), rule)
+            self.comb += rule.count.eq(decide)
+            self.rules.append(rule)
+
+        # first matching rule (not counting only) gives the action.
+        decision = self.default_action.storage
+        for rule in reversed(self.rules):
+            decision = Mux(rule.match & (rule.action.storage != filter_count), rule.action.storage, decision)
+        self.comb += action.eq(decision)
+
+        drop = Signal()
+
+        self.submodules.fsm = fsm = FSM(reset_state="HEADER")
+        fsm.act("HEADER",
+            sink.ready.eq(1),
+            If(sink.valid,
+                NextValue(beat0_dat, sink.dat),
+                NextValue(beat0_be, sink.be),
+                NextState("DECIDE")
+            )
+        )
+        fsm.act("DECIDE",
+            If(sink.valid,
+                If(action == filter_drop,
+                    decide.eq(1),
+                    NextValue(drop, 1),
+                    NextState("COPY")
+                ).Else(
+                    source.valid.eq(1),
+                    source.dat.eq(beat0_dat),
+                    source.be.eq(beat0_be),
+                    If(source.ready,
+                        decide.eq(1),
+                        NextValue(drop, 0),
+                        NextState("COPY")
+                    )
+                )
+            )
+        )
+        fsm.act("COPY",
+            If(drop,
+                sink.ready.eq(1)
+            ).Else(
+                sink.connect(source)
+            ),
+            If(sink.valid & sink.ready & sink.last,
+                NextState("HEADER")
+            )
+        )
+
+        self.sync += If(decide,
+            If(action == filter_drop,
+                self.dropped.status.eq(self.dropped.status + 1)
+            ).Else(
+                self.passed.status.eq(self.passed.status + 1)
+            )
+        )
@@ -4,16 +4,40 @@
 
 from migen import *
 from migen.fhdl.specials import Tristate
+from migen.genlib.cdc import MultiReg, BusSynchronizer
 
 from litex.soc.interconnect import stream
+from litex.soc.interconnect.csr import *
 from litex.soc.cores.usb_fifo import phy_description
 
-class FT601Sync(Module):
-    def __init__(self, pads, dw=32, timeout=1024):
-        read_fifo = ClockDomainsRenamer({"write": "usb", "read": "sys"})(stream.AsyncFIFO(phy_description(dw), 128))
-        write_fifo = ClockDomainsRenamer({"write": "sys", "read": "usb"})(stream.AsyncFIFO(phy_description(dw), 128))
 
-        read_buffer = ClockDomainsRenamer("usb")(stream.SyncFIFO(phy_description(dw), 4))
+def _fill_quarters(level, depth):
+    # number of quarters of a FIFO filled (0-3).
+    return Mux(level >= 3*depth//4, 3,
+           Mux(level >= 2*depth//4, 2,
+           Mux(level >= 1*depth//4, 1, 0)))
+
+
+class FT601Sync(Module, AutoCSR):
+    def __init__(self, pads, dw=32, timeout=1024, read_fifo_depth=128, write_fifo_depth=128,
+        read_buffer_depth=4, deep_fifo_depth=0, adaptive=False):
+        # Arbitration: when both directions have data, the bus is kept for a quantum of cycles
+        # (reset: timeout) before switching. In adaptive mode (reset: adaptive), the uplink quantum
+        # is doubled for each quarter of the uplink path filled (up to x8) and the downlink quantum
+        # is halved for each quarter of the downlink path filled (its consumer is slower than the
+        # bus).
+        self.uplink_quantum = CSRStorage(16, reset=timeout)
+        self.downlink_quantum = CSRStorage(16, reset=timeout)
+        self.adaptive = CSRStorage(reset=adaptive)
+        self.turnarounds = CSRStatus(32)
+        self.turnaround_cycles = CSRStatus(32)
+
+        # # #
+
+        read_fifo = ClockDomainsRenamer({"write": "usb", "read": "sys"})(stream.AsyncFIFO(phy_description(dw), read_fifo_depth))
+        write_fifo = ClockDomainsRenamer({"write": "sys", "read": "usb"})(stream.AsyncFIFO(phy_description(dw), write_fifo_depth))
+
+        read_buffer = ClockDomainsRenamer("usb")(stream.SyncFIFO(phy_description(dw), read_buffer_depth))
         self.comb += read_buffer.source.connect(read_fifo.sink)
 
         self.submodules += read_fifo
@@ -25,6 +49,75 @@ class FT601Sync(Module):
         self.sink = write_fifo.sink
         self.source = read_fifo.source
 
+        # fill of the uplink/downlink paths (sys domain), in quarters.
+        uplink_fill = Signal(2)
+        downlink_fill = Signal(2)
+
+        # Deep mode: BRAM FIFOs (sys domain) in front of the clock domain crossing FIFOs, to
+        # absorb the bursts while the bus is used in the other direction.
+        if deep_fifo_depth:
+            read_deep_fifo = stream.SyncFIFO(phy_description(dw), deep_fifo_depth, buffered=True)
+            write_deep_fifo = stream.SyncFIFO(phy_description(dw), deep_fifo_depth, buffered=True)
+            self.submodules += read_deep_fifo, write_deep_fifo
+            self.comb += [
+                read_fifo.source.connect(read_deep_fifo.sink),
+                write_deep_fifo.source.connect(write_fifo.sink)
+            ]
+            self.sink = write_deep_fifo.sink
+            self.source = read_deep_fifo.source
+            self.sync += [
+                uplink_fill.eq(_fill_quarters(write_deep_fifo.level, deep_fifo_depth)),
+                downlink_fill.eq(_fill_quarters(read_deep_fifo.level, deep_fifo_depth))
+            ]
+        else:
+            # only full/stalled is known on the sys side of the clock domain crossing FIFOs.
+            self.sync += [
+                uplink_fill.eq(Mux(write_fifo.sink.valid & ~write_fifo.sink.ready, 3, 0)),
+                downlink_fill.eq(Mux(read_fifo.source.valid & ~read_fifo.source.ready, 3, 0))
+            ]
+
+        # gray coded so that the usb domain samples either the previous or the new value.
+        uplink_fill_gray = Signal(2)
+        downlink_fill_gray = Signal(2)
+        self.sync += [
+            uplink_fill_gray.eq(uplink_fill ^ uplink_fill[1:]),
+            downlink_fill_gray.eq(downlink_fill ^ downlink_fill[1:])
+        ]
+
+        uplink_quantum = Signal(16)
+        downlink_quantum = Signal(16)
+        adaptive = Signal()
+        _uplink_fill_gray = Signal(2)
+        _downlink_fill_gray = Signal(2)
+        self.specials += [
+            MultiReg(self.uplink_quantum.storage, uplink_quantum, "usb"),
+            MultiReg(self.downlink_quantum.storage, downlink_quantum, "usb"),
+            MultiReg(self.adaptive.storage, adaptive, "usb"),
+            MultiReg(uplink_fill_gray, _uplink_fill_gray, "usb"),
+            MultiReg(downlink_fill_gray, _downlink_fill_gray, "usb"),
+        ]
+        _uplink_fill = Signal(2)
+        _downlink_fill = Signal(2)
+        self.comb += [
+            _uplink_fill.eq(Cat(_uplink_fill_gray[0] ^ _uplink_fill_gray[1], _uplink_fill_gray[1])),
+            _downlink_fill.eq(Cat(_downlink_fill_gray[0] ^ _downlink_fill_gray[1], _downlink_fill_gray[1])),
+        ]
+
+        # quanta of the next grants, latched with the levels of the grant cycle.
+        write_quantum = Signal(16 + 3)
+        read_quantum = Signal(16)
+        self.comb += [
+            If(adaptive,
+                write_quantum.eq(uplink_quantum << _uplink_fill),
+                read_quantum.eq(downlink_quantum >> _downlink_fill)
+            ).Else(
+                write_quantum.eq(uplink_quantum),
+                read_quantum.eq(downlink_quantum)
+            )
+        ]
+        self.write_limit = write_limit = Signal(16 + 3)
+        self.read_limit = read_limit = Signal(16)
+
         self.tdata_w = tdata_w = Signal(dw)
         self.data_r = data_r = Signal(dw)
         self.data_oe = data_oe = Signal()
@@ -91,8 +184,8 @@ class FT601Sync(Module):
 
         self.wants_read = wants_read = Signal()
         self.wants_write = wants_write = Signal()
-        self.cnt_write = cnt_write = Signal(max=timeout+1)
-        self.cnt_read = cnt_read = Signal(max=timeout+1)
+        self.cnt_write = cnt_write = Signal(16 + 3 + 1)
+        self.cnt_read = cnt_read = Signal(16 + 1)
 
         first_write = Signal()
 
@@ -109,6 +202,36 @@ class FT601Sync(Module):
                                  fsm.ongoing("READ")))
         ]
 
+        # Turnaround counters: direction switches and cycles without transfer while switching
+        # (IDLE/RDWAIT with a pending transfer).
+        self.turnaround = turnaround = Signal()
+        last_read = Signal()
+        turnarounds = Signal(32)
+        turnaround_cycles = Signal(32)
+        self.comb += turnaround.eq((fsm.ongoing("RDWAIT") & ~last_read) | (fsm.ongoing("WRITE") & last_read))
+        self.sync.usb += [
+            If(fsm.ongoing("RDWAIT"),
+                last_read.eq(1)
+            ).Elif(fsm.ongoing("WRITE"),
+                last_read.eq(0)
+            ),
+            If(turnaround,
+                turnarounds.eq(turnarounds + 1)
+            ),
+            If((fsm.ongoing("IDLE") | fsm.ongoing("RDWAIT")) & (wants_read | wants_write),
+                turnaround_cycles.eq(turnaround_cycles + 1)
+            )
+        ]
+        turnarounds_sync = BusSynchronizer(32, "usb", "sys")
+        turnaround_cycles_sync = BusSynchronizer(32, "usb", "sys")
+        self.submodules += turnarounds_sync, turnaround_cycles_sync
+        self.comb += [
+            turnarounds_sync.i.eq(turnarounds),
+            self.turnarounds.status.eq(turnarounds_sync.o),
+            turnaround_cycles_sync.i.eq(turnaround_cycles),
+            self.turnaround_cycles.status.eq(turnaround_cycles_sync.o)
+        ]
+
         self.sync.usb += [
             If(~fsm.ongoing("READ"),
                 If(temptoread,
@@ -134,6 +257,7 @@ class FT601Sync(Module):
             If(wants_write,
                 oe_n.eq(1),
                 NextValue(cnt_write, 0),
+                NextValue(write_limit, write_quantum),
                 NextValue(first_write, 1),
                 NextState("WRITE"),
             ).Elif(wants_read,
@@ -164,8 +288,9 @@ class FT601Sync(Module):
                 data_w.eq(tempsendval),
                 wr_n.eq(0),
                 NextValue(temptosend, 0)
-            ).Elif(cnt_write > timeout,
+            ).Elif(cnt_write > write_limit,
                 oe_n.eq(0),
+                wr_n.eq(1),
                 NextState("RDWAIT")
             ).Elif(write_fifo.source.valid,
                 oe_n.eq(1),
@@ -187,6 +312,7 @@ class FT601Sync(Module):
             oe_n.eq(0),
             wr_n.eq(1),
             NextValue(cnt_read, 0),
+            NextValue(read_limit, read_quantum),
             NextState("READ")
         )
 
@@ -200,10 +326,15 @@ class FT601Sync(Module):
                 oe_n.eq(0),
                 rd_n.eq(1),
                 NextState("IDLE"),
-            ).Elif(cnt_read > timeout,
+            ).Elif(cnt_read > read_limit,
+                # the word on the bus is read (rd_n of the previous cycle), keep it.
+                NextValue(tempreadval, data_r),
+                NextValue(temptoread, 1),
                 NextValue(cnt_write, 0),
+                NextValue(write_limit, write_quantum),
                 NextValue(first_write, 1),
                 NextState("WRITE"),
+                rd_n.eq(1),
                 oe_n.eq(1),
             ).Else(
                 oe_n.eq(0),
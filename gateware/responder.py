@@ -0,0 +1,207 @@
+# This file is Copyright (c) 2026 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+from migen import *
+
+from litex.soc.interconnect import stream, wishbone
+from litex.soc.interconnect.csr import *
+from litex.soc.interconnect.stream import Converter
+
+from litepcie.common import phy_layout as tlp_description
+
+
+class TLPResponder(Module, AutoCSR):
+    def __init__(self, completer_id, size=16*1024, max_length=32):
+        self.sink = sink = stream.Endpoint(tlp_description(64))
+        self.source = source = stream.Endpoint(tlp_description(64))         # forwarded TLPs
+        self.cpl_source = cpl_source = stream.Endpoint(tlp_description(64)) # completions
+
+        self.enable = CSRStorage()
+        self.base   = CSRStorage(32)
+        self.hits   = CSRStatus(32)
+        self.misses = CSRStatus(32)
+
+        # Memory window, written by the host through wishbone.
+        mem = Memory(32, size//4)
+        self.submodules.sram = wishbone.SRAM(mem)
+        self.bus = self.sram.bus
+
+        # # #
+
+        # MRd (3 dwords header) entirely within [base, base + size) and of up to max_length
+        # dwords (<= 128 bytes: always within max_payload_size) are answered with a single
+        # CPLD read from the memory window, other TLPs are forwarded (to the host).
+        dw0 = Signal(32)
+        dw1 = Signal(32)
+        dw2 = Signal(32)
+        beat0_dat = Signal(64)
+        beat0_be  = Signal(8)
+        self.comb += [
+            dw0.eq(beat0_dat[0:32]),
+            dw1.eq(beat0_dat[32:64]),
+            dw2.eq(sink.dat[0:32])
+        ]
+
+        fmt_type = Signal(7)
+        length   = Signal(10)
+        offset   = Signal(32)
+        hit      = Signal()
+        self.comb += [
+            fmt_type.eq(dw0[24:31]),
+            length.eq(dw0[0:10]),
+            offset.eq((dw2 & 0xfffffffc) - self.base.storage),
+            hit.eq(self.enable.storage &
+                (fmt_type == 0b0000000) & # mem_rd32
+                (length != 0) & (length <= max_length) &
+                (offset < size) & ((offset + 4*length) <= size))
+        ]
+
+        # Completion header -------------------------------------------------------------------------
+        first_be  = dw1[0:4]
+        last_be   = dw1[4:8]
+        first_lead = Signal(2)
+        first_span = Signal(3)
+        last_trail = Signal(2)
+        self.comb += [
+            Case(first_be, {
+                0b0000: [first_lead.eq(0), first_span.eq(1)],
+                0b0001: [first_lead.eq(0), first_span.eq(1)],
+                0b0010: [first_lead.eq(1), first_span.eq(1)],
+                0b0011: [first_lead.eq(0), first_span.eq(2)],
+                0b0100: [first_lead.eq(2), first_span.eq(1)],
+                0b0101: [first_lead.eq(0), first_span.eq(3)],
+                0b0110: [first_lead.eq(1), first_span.eq(2)],
+                0b0111: [first_lead.eq(0), first_span.eq(3)],
+                0b1000: [first_lead.eq(3), first_span.eq(1)],
+                0b1001: [first_lead.eq(0), first_span.eq(4)],
+                0b1010: [first_lead.eq(1), first_span.eq(3)],
+                0b1011: [first_lead.eq(0), first_span.eq(4)],
+                0b1100: [first_lead.eq(2), first_span.eq(2)],
+                0b1101: [first_lead.eq(0), first_span.eq(4)],
+                0b1110: [first_lead.eq(1), first_span.eq(3)],
+                0b1111: [first_lead.eq(0), first_span.eq(4)],
+            }),
+            If(last_be[3],
+                last_trail.eq(0)
+            ).Elif(last_be[2],
+                last_trail.eq(1)
+            ).Elif(last_be[1],
+                last_trail.eq(2)
+            ).Else(
+                last_trail.eq(3)
+            )
+        ]
+        byte_count = Signal(12)
+        self.comb += If(length == 1,
+                byte_count.eq(first_span)
+            ).Else(
+                byte_count.eq(4*length - first_lead - last_trail)
+            )
+
+        cpl_header = Array(Signal(32) for i in range(3))
+        cpl_length = Signal(10)
+        cpl_word   = Signal(max=size//4)
+
+        # Request decoding -----------------------------------------------------------------------
+
+        self.submodules.fsm = fsm = FSM(reset_state="HEADER")
+        fsm.act("HEADER",
+            sink.ready.eq(1),
+            If(sink.valid,
+                NextValue(beat0_dat, sink.dat),
+                NextValue(beat0_be, sink.be),
+                NextState("DECIDE")
+            )
+        )
+        fsm.act("DECIDE",
+            If(sink.valid,
+                If(hit,
+                    # consume the request (2 beats), wait for the completion.
+                    sink.ready.eq(1),
+                    NextValue(cpl_header[0], (0b10 << 29) | (0b01010 << 24) | (dw0 & 0x00703000) | length),
+                    NextValue(cpl_header[1], (completer_id << 16) | byte_count),
+                    NextValue(cpl_header[2], (dw1[16:32] << 16) | (dw1[8:16] << 8) |
+                                             Cat(first_lead, dw2[2:7])),
+                    NextValue(cpl_length, length),
+                    NextValue(cpl_word, offset[2:]),
+                    NextValue(self.hits.status, self.hits.status + 1),
+                    NextState("COMPLETE")
+                ).Else(
+                    source.valid.eq(1),
+                    source.dat.eq(beat0_dat),
+                    source.be.eq(beat0_be),
+                    If(source.ready,
+                        If(fmt_type == 0b0000000,
+                            NextValue(self.misses.status, self.misses.status + 1)
+                        ),
+                        NextState("COPY")
+                    )
+                )
+            )
+        )
+        fsm.act("COPY",
+            sink.connect(source),
+            If(sink.valid & sink.ready & sink.last,
+                NextState("HEADER")
+            )
+        )
+
+        # Completion generation (dwords, converted to 64-bit beats) ----------------------------
+
+        converter = Converter(32, 64, report_valid_token_count=True)
+        self.submodules += converter
+        self.comb += [
+            cpl_source.valid.eq(converter.source.valid),
+            cpl_source.last.eq(converter.source.last),
+            cpl_source.dat.eq(converter.source.data),
+            If(converter.source.valid_token_count == 1,
+                cpl_source.be.eq(0x0f)
+            ).Else(
+                cpl_source.be.eq(0xff)
+            ),
+            converter.source.ready.eq(cpl_source.ready)
+        ]
+
+        port = mem.get_port()
+        self.specials += port
+
+        # dat_r is mem[word] one cycle after word is set (port.adr follows the next word).
+        word      = Signal(max=size//4)
+        next_word = Signal(max=size//4)
+        count     = Signal(10)
+        dword     = converter.sink
+        self.sync += word.eq(next_word)
+        self.comb += [
+            If(fsm.ongoing("COMPLETE"),
+                next_word.eq(cpl_word)
+            ).Elif(fsm.ongoing("DATA") & dword.ready,
+                next_word.eq(word + 1)
+            ).Else(
+                next_word.eq(word)
+            ),
+            port.adr.eq(next_word)
+        ]
+
+        fsm.act("COMPLETE",
+            dword.valid.eq(1),
+            dword.data.eq(cpl_header[count]),
+            If(dword.ready,
+                NextValue(count, count + 1),
+                If(count == 2,
+                    NextValue(count, 0),
+                    NextState("DATA")
+                )
+            )
+        )
+        fsm.act("DATA",
+            dword.valid.eq(1),
+            dword.last.eq(count == cpl_length - 1),
+            dword.data.eq(port.dat_r),
+            If(dword.ready,
+                NextValue(count, count + 1),
+                If(dword.last,
+                    NextValue(count, 0),
+                    NextState("HEADER")
+                )
+            )
+        )
@@ -0,0 +1,60 @@
+# This file is Copyright (c) 2026 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+from migen import *
+
+from litex.soc.interconnect.csr import *
+
+
+class Telemetry(Module, AutoCSR):
+    def __init__(self):
+        self.latch = CSR()
+
+        # # #
+
+        # Counters run freely and are copied to their CSRs on a latch write, so that all the
+        # values read by the host are sampled on the same cycle (the host computes rates from
+        # the differences between samples, modulo the counter width).
+        self._csrs = []
+
+    def get_csrs(self):
+        return [self.latch] + self._csrs
+
+    def add_counter(self, name, increment, width=32):
+        counter = Signal(width)
+        csr = CSRStatus(width, name=name)
+        self.sync += [
+            counter.eq(counter + increment),
+            If(self.latch.re, csr.status.eq(counter))
+        ]
+        self._csrs.append(csr)
+
+    def add_event(self, name, event):
+        self.add_counter(name, event)
+
+    def add_high_water_mark(self, name, level, width=32):
+        # highest level since the last latch.
+        mark = Signal(width)
+        csr = CSRStatus(width, name=name)
+        self.sync += [
+            If(self.latch.re,
+                csr.status.eq(mark),
+                mark.eq(level)
+            ).Elif(level > mark,
+                mark.eq(level)
+            )
+        ]
+        self._csrs.append(csr)
+
+    def add_stream(self, name, endpoint, dw, with_packets=True):
+        # packets/bytes transferred and stall cycles (valid but not ready) of a stream.
+        transfer = endpoint.valid & endpoint.ready
+        if hasattr(endpoint, "be"):
+            nbytes = Signal(max=dw//8 + 1)
+            self.comb += nbytes.eq(sum(endpoint.be[i] for i in range(dw//8)))
+        else:
+            nbytes = dw//8
+        if with_packets:
+            self.add_event(name + "_packets", transfer & endpoint.last)
+        self.add_counter(name + "_bytes", Mux(transfer, nbytes, 0), width=64)
+        self.add_event(name + "_stalls", endpoint.valid & ~endpoint.ready)
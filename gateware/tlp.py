@@ -4,118 +4,289 @@
 from migen import *
 
 from litex.soc.interconnect import stream
-from litex.soc.interconnect.stream import Converter, StrideConverter
+from litex.soc.interconnect.csr import *
+from litex.soc.interconnect.stream import Converter
 
 import sys
 sys.path.append("../")
 
 from litepcie.common import phy_layout as tlp_description
 from gateware.usb import user_description as usb_description
+from gateware.usb import USBAggregator
 
 
-class TLPSender(Module):
-    def __init__(self, identifier, fifo_depth=512):
+class TLPSender(Module, AutoCSR):
+    def __init__(self, identifier, fifo_depth=512, with_timestamp=False, with_length=False, dw=32,
+        max_packet_length=2048, max_payload_size=512):
+        # fifo_depth is in dwords, the fifo is dw bits wide (with dw=64, the TLPs are not
+        # narrowed before the USB crossbar). The USB packets are at most max_packet_length bytes,
+        # the TLPs from the PHY carry at most max_payload_size bytes (512 for S7PCIEPHY): the
+        # largest TLP must fit in the fifo and in a USB packet.
+        assert dw in [32, 64]
+        max_tlp_dwords = 4 + max_payload_size//4 + (2 if with_timestamp else 0)
+        max_packet_dwords = max_packet_length//4
+        assert fifo_depth >= max_tlp_dwords
+        assert max_packet_dwords >= max_tlp_dwords + (1 if with_length else 0)
         self.sink = sink = stream.Endpoint(tlp_description(64))
-        self.source = source = stream.Endpoint(usb_description(32))
+        self.source = source = stream.Endpoint(usb_description(dw))
+
+        # Aggregation policy: the buffered TLPs are sent in one USB packet once flush_bytes are
+        # buffered, flush_tlps TLPs are buffered or the oldest TLP has waited flush_timeout
+        # cycles (a USB packet only contains complete TLPs so it can exceed flush_bytes by one
+        # TLP). The TLPs are also sent when the fifo is full or when the next TLP would not fit
+        # in max_packet_length (the fifo is not written until they are taken).
+        self.flush_bytes   = CSRStorage(16, reset=1024)
+        self.flush_tlps    = CSRStorage(8,  reset=16)
+        self.flush_timeout = CSRStorage(32, reset=256)
 
         # # #
 
         buf = stream.SyncFIFO(tlp_description(64), 128)
-        converter = StrideConverter(tlp_description(64),
-                                    tlp_description(32))
-        fifo = stream.SyncFIFO(tlp_description(32), fifo_depth)
-        self.submodules += buf, converter, fifo
-        self.comb += [
+        fifo = stream.SyncFIFO(tlp_description(dw), fifo_depth*32//dw)
+        self.submodules += buf, fifo
+
+        # telemetry
+        self.buf_level  = buf.level
+        self.fifo_level = fifo.level
+
+        hold = Signal() # the TLP being written does not fit in the USB packet of the buffered TLPs
+        if dw == 32:
+            # Each beat is written as 2 dwords, low dword first. The high dword is skipped when it
+            # is not valid (be) and last is then set on the low dword.
+            high = Signal()
+            has_high = Signal()
+            self.comb += [
+                has_high.eq(buf.source.be[4:] != 0),
+                fifo.sink.valid.eq(buf.source.valid & ~hold),
+                fifo.sink.be.eq(0xf),
+                If(high,
+                    fifo.sink.dat.eq(buf.source.dat[32:]),
+                    fifo.sink.last.eq(buf.source.last),
+                    buf.source.ready.eq(fifo.sink.ready & ~hold)
+                ).Else(
+                    fifo.sink.dat.eq(buf.source.dat[:32]),
+                    fifo.sink.last.eq(buf.source.last & ~has_high),
+                    buf.source.ready.eq(fifo.sink.ready & ~hold & ~has_high)
+                )
+            ]
+            self.sync += \
+                If(fifo.sink.valid & fifo.sink.ready,
+                    high.eq(~high & has_high)
+                )
+        else:
+            self.comb += [
+                buf.source.connect(fifo.sink, omit={"valid", "ready"}),
+                fifo.sink.valid.eq(buf.source.valid & ~hold),
+                buf.source.ready.eq(fifo.sink.ready & ~hold)
+            ]
+
+        # dwords of a fifo beat.
+        def beat_dwords(be):
+            return 1 if dw == 32 else Mux(be[4:] != 0, 2, 1)
+
+        if with_timestamp:
+            # Each TLP is preceded by the 64-bit value of a free-running cycle counter taken when
+            # its first beat is presented (sent as 2 dwords, low dword first).
+            counter = Signal(64)
+            timestamp = Signal(64)
+            self.sync += counter.eq(counter + 1)
+
+            self.submodules.timestamp_fsm = timestamp_fsm = FSM(reset_state="TIMESTAMP")
+            self.sync += If(~(timestamp_fsm.ongoing("TIMESTAMP") & sink.valid), timestamp.eq(counter))
+            timestamp_fsm.act("TIMESTAMP",
+                buf.sink.valid.eq(sink.valid),
+                buf.sink.dat.eq(timestamp),
+                buf.sink.be.eq(0xff),
+                If(buf.sink.valid & buf.sink.ready,
+                    NextState("COPY")
+                )
+            )
+            timestamp_fsm.act("COPY",
                 sink.connect(buf.sink),
-                buf.source.connect(converter.sink),
-                converter.source.connect(fifo.sink),
-                fifo.sink.valid.eq(converter.source.valid &
-                                   (converter.source.be == 0xf))
+                If(sink.valid & sink.ready & sink.last,
+                    NextState("TIMESTAMP")
+                )
+            )
+        else:
+            self.comb += sink.connect(buf.sink)
+
+        # Complete TLPs in the fifo.
+        write   = Signal(max=dw//32 + 1) # dwords written
+        tlp_end = Signal()
+        tlp_dwords = Signal(max=fifo_depth + 1)
+        self.comb += [
+            If(fifo.sink.valid & fifo.sink.ready,
+                write.eq(beat_dwords(fifo.sink.be))
+            ),
+            tlp_end.eq(fifo.sink.valid & fifo.sink.ready & fifo.sink.last)
         ]
+        self.sync += \
+            If(tlp_end,
+                tlp_dwords.eq(0)
+            ).Elif(write,
+                tlp_dwords.eq(tlp_dwords + write)
+            )
+
+        take = Signal()
+        available = Signal(max=fifo_depth + 1)
+        tlps = Signal(max=fifo_depth + 1)
+        self.sync += \
+            If(take,
+                available.eq(Mux(tlp_end, tlp_dwords + write, 0)),
+                tlps.eq(tlp_end)
+            ).Elif(tlp_end,
+                available.eq(available + tlp_dwords + write),
+                tlps.eq(tlps + 1)
+            )
+
+        # USB packet dwords with the TLP being written (and its next beat).
+        self.comb += hold.eq((available != 0) &
+            (available + (tlps + 1 if with_length else 0) + tlp_dwords + dw//32 > max_packet_dwords))
 
-        level = Signal(max=fifo_depth)
-        level_update = Signal()
-        self.sync += If(level_update, level.eq(fifo.level))
+        timer = Signal(32)
+        flush = Signal()
+        self.comb += flush.eq(
+            (available >= self.flush_bytes.storage[2:]) |
+            (tlps >= self.flush_tlps.storage) |
+            (timer >= self.flush_timeout.storage) |
+            ~fifo.sink.ready |
+            hold)
 
-        counter = Signal(max=fifo_depth)
+        if with_length:
+            # Each TLP is preceded by a dword giving its length in dwords (timestamp included),
+            # so that the host can frame the TLPs without decoding their headers. The lengths of
+            # the complete TLPs of the fifo are stored when their last dword is written (sized for
+            # 1 dword TLPs: at most fifo_depth complete TLPs are in the fifo).
+            lengths = stream.SyncFIFO([("length", 16)], fifo_depth)
+            self.submodules += lengths
+            self.comb += [
+                lengths.sink.valid.eq(tlp_end),
+                lengths.sink.length.eq(tlp_dwords + write)
+            ]
+
+        level = Signal(max=fifo_depth + 1)
+        level_tlps = Signal(max=fifo_depth + 1)
+        counter = Signal(max=fifo_depth + 1)
         counter_reset = Signal()
         counter_ce = Signal()
+        dwords = Signal(max=dw//32 + 1)
+        self.comb += dwords.eq(beat_dwords(fifo.source.be))
         self.sync += \
             If(counter_reset,
                 counter.eq(0)
             ).Elif(counter_ce,
-                counter.eq(counter + 1)
+                counter.eq(counter + dwords)
             )
 
         self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        self.sync += \
+            If(fsm.ongoing("IDLE") & (available != 0),
+                timer.eq(timer + 1)
+            ).Else(
+                timer.eq(0)
+            )
         fsm.act("IDLE",
-            If(fifo.source.valid,
-                level_update.eq(1),
+            If((available != 0) & flush,
+                take.eq(1),
+                NextValue(level, available),
+                NextValue(level_tlps, tlps),
                 counter_reset.eq(1),
-                NextState("SEND")
+                NextState("LENGTH" if with_length else "SEND")
             )
         )
+        self.comb += [
+            source.dst.eq(identifier),
+            source.length.eq(4*(level + (level_tlps if with_length else 0)))
+        ]
+        if with_length:
+            fsm.act("LENGTH",
+                source.valid.eq(lengths.source.valid),
+                source.data.eq(lengths.source.length),
+                source.be.eq(0xf),
+                If(source.valid & source.ready,
+                    lengths.source.ready.eq(1),
+                    NextState("SEND")
+                )
+            )
+        send_end = If(source.last, NextState("IDLE"))
+        if with_length:
+            send_end.Elif(fifo.source.last, NextState("LENGTH"))
         fsm.act("SEND",
             source.valid.eq(fifo.source.valid),
-            If(level == 0,
-                source.last.eq(1),
-            ).Else(
-                source.last.eq(counter == (level-1)),
-            ),
-            source.dst.eq(identifier),
-            If(level == 0,
-                source.length.eq(4),
-            ).Else(
-                source.length.eq(4*level),
-            ),
+            source.last.eq(counter + dwords == level),
             source.data.eq(fifo.source.dat),
+            source.be.eq(fifo.source.be),
             fifo.source.ready.eq(source.ready),
             If(source.valid & source.ready,
                 counter_ce.eq(1),
-                If(source.last,
-                    NextState("IDLE")
-                )
+                send_end
             )
         )
 
 
 class TLPReceiver(Module):
-    def __init__(self):
-        self.sink = sink = stream.Endpoint(usb_description(32))
+    def __init__(self, dw=32):
+        assert dw in [32, 64]
+        self.sink = sink = stream.Endpoint(usb_description(dw))
         self.source = source = stream.Endpoint(tlp_description(64))
 
         # # #
 
-        converter = Converter(32, 64, report_valid_token_count=True)
-        self.submodules += converter
+        if dw == 32:
+            converter = Converter(32, 64, report_valid_token_count=True)
+            self.submodules += converter
 
-        self.comb += [
-            converter.sink.valid.eq(self.sink.valid),
-            converter.sink.last.eq(self.sink.last),
-            self.sink.ready.eq(converter.sink.ready),
-            converter.sink.data.eq(self.sink.data),
-
-            source.valid.eq(converter.source.valid),
-            source.last.eq(converter.source.last),
-            If(converter.source.valid_token_count == 1,
-                source.be.eq(0x0f)
-            ).Else(
-                source.be.eq(0xff)
-            ),
-            source.dat.eq(converter.source.data),
-            converter.source.ready.eq(source.ready)
-        ]
+            self.comb += [
+                converter.sink.valid.eq(self.sink.valid),
+                converter.sink.last.eq(self.sink.last),
+                self.sink.ready.eq(converter.sink.ready),
+                converter.sink.data.eq(self.sink.data),
 
+                source.valid.eq(converter.source.valid),
+                source.last.eq(converter.source.last),
+                If(converter.source.valid_token_count == 1,
+                    source.be.eq(0x0f)
+                ).Else(
+                    source.be.eq(0xff)
+                ),
+                source.dat.eq(converter.source.data),
+                converter.source.ready.eq(source.ready)
+            ]
+        else:
+            # beats are already paired by the USB core (be = 0x0f on a last single dword).
+            self.comb += [
+                source.valid.eq(sink.valid),
+                source.last.eq(sink.last),
+                source.dat.eq(sink.data),
+                source.be.eq(sink.be),
+                sink.ready.eq(source.ready)
+            ]
 
-class TLP(Module):
-    def __init__(self, usb_core, identifier):
-        self.submodules.sender = sender = TLPSender(identifier)
-        self.submodules.receiver = receiver = TLPReceiver()
-        usb_port = usb_core.crossbar.get_port(identifier)
-        self.comb += [
-            sender.source.connect(usb_port.sink),
-            usb_port.source.connect(receiver.sink)
-        ]
+
+class TLP(Module, AutoCSR):
+    def __init__(self, usb_core, identifier, with_aggregation=False, with_timestamp=False,
+        with_length=False, dw=32):
+        # with aggregation, the sender packets fit in an aggregated packet with their sub-header.
+        # The aggregator works on dwords: at 64-bit, down/up converting around it is slower than
+        # the 32-bit path, so aggregation is only supported at 32-bit.
+        assert not (with_aggregation and dw != 32)
+        aggregator_max_length = 2048
+        self.submodules.sender = sender = TLPSender(identifier,
+            with_timestamp    = with_timestamp,
+            with_length       = with_length,
+            dw                = dw,
+            max_packet_length = aggregator_max_length - 4 if with_aggregation else 2048)
+        self.submodules.receiver = receiver = TLPReceiver(dw)
+        usb_port = usb_core.crossbar.get_port(identifier, dw=dw)
+        if with_aggregation:
+            self.submodules.aggregator = aggregator = USBAggregator(max_length=aggregator_max_length)
+            self.comb += [
+                sender.source.connect(aggregator.sink),
+                aggregator.source.connect(usb_port.sink)
+            ]
+        else:
+            self.comb += sender.source.connect(usb_port.sink)
+        self.comb += usb_port.source.connect(receiver.sink)
 
 
 if __name__ == '__main__':
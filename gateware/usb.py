@@ -41,6 +41,7 @@ def user_description(dw):
     ]
     payload_layout = [
         ("data", dw),
+        ("be",   dw//8),
         ("error", dw//8)
     ]
     return EndpointDescription(payload_layout, param_layout)
@@ -64,6 +65,75 @@ class USBUserPort(USBSlavePort):
         USBSlavePort.__init__(self, dw, tag)
 
 
+class USBDownConverter(Module):
+    def __init__(self, dw=64):
+        assert dw == 64
+        self.sink = sink = stream.Endpoint(user_description(dw))
+        self.source = source = stream.Endpoint(user_description(32))
+
+        # # #
+
+        # Each beat is sent as 2 words, low word first. The high word is skipped when it is not
+        # valid (be), so that packets with an odd number of words keep their length.
+        high = Signal()
+        has_high = Signal()
+        self.comb += [
+            has_high.eq(sink.be[4:] != 0),
+            source.valid.eq(sink.valid),
+            source.dst.eq(sink.dst),
+            source.length.eq(sink.length),
+            source.be.eq(0xf),
+            If(high,
+                source.data.eq(sink.data[32:]),
+                source.last.eq(sink.last),
+                sink.ready.eq(source.ready)
+            ).Else(
+                source.data.eq(sink.data[:32]),
+                source.last.eq(sink.last & ~has_high),
+                sink.ready.eq(source.ready & ~has_high)
+            )
+        ]
+        self.sync += \
+            If(source.valid & source.ready,
+                high.eq(~high & has_high)
+            )
+
+
+class USBUpConverter(Module):
+    def __init__(self, dw=64):
+        assert dw == 64
+        self.sink = sink = stream.Endpoint(user_description(32))
+        self.source = source = stream.Endpoint(user_description(dw))
+
+        # # #
+
+        # Words are paired in beats, low word first. The last word of a packet with an odd
+        # number of words is sent alone (be = 0x0f).
+        low = Signal(32)
+        low_valid = Signal()
+        send = Signal()
+        self.comb += [
+            send.eq(low_valid | sink.last),
+            source.valid.eq(sink.valid & send),
+            source.last.eq(sink.last),
+            source.dst.eq(sink.dst),
+            source.length.eq(sink.length),
+            If(low_valid,
+                source.data.eq(Cat(low, sink.data)),
+                source.be.eq(0xff)
+            ).Else(
+                source.data.eq(sink.data),
+                source.be.eq(0x0f)
+            ),
+            sink.ready.eq(~send | source.ready)
+        ]
+        self.sync += \
+            If(sink.valid & sink.ready,
+                low.eq(sink.data),
+                low_valid.eq(~send)
+            )
+
+
 class USBPacketizer(Module):
     def __init__(self):
         self.sink = sink = stream.Endpoint(user_description(32))
@@ -77,49 +147,151 @@ class USBPacketizer(Module):
         #   - dst      : 1 byte
         #   - length   : 4 bytes
         #   - payload
-        header = [
+        header = Array([
             # preamble
-            0x5aa55aa5,
+            Constant(0x5aa55aa5, 32),
             # dst
             sink.dst,
             # length
             sink.length
-        ]
+        ])
+
+        # Header words are sent directly from the sink parameters as soon as a packet is
+        # available and the header of the next packet follows the last word of the previous
+        # one: no turnaround cycle, a packet takes len(header) + payload cycles.
+        count = Signal(max=len(header))
 
-        header_unpack = stream.Unpack(len(header), phy_description(32))
-        self.submodules += header_unpack
+        fsm = FSM(reset_state="INSERT_HEADER")
+        self.submodules += fsm
 
-        for i, byte in enumerate(header):
-            chunk = getattr(header_unpack.sink.payload, "chunk" + str(i))
-            self.comb += chunk.data.eq(byte)
+        fsm.act("INSERT_HEADER",
+            source.valid.eq(sink.valid),
+            source.data.eq(header[count]),
+            If(source.valid & source.ready,
+                NextValue(count, count + 1),
+                If(count == len(header) - 1,
+                    NextValue(count, 0),
+                    NextState("COPY")
+                )
+            )
+        )
+
+        fsm.act("COPY",
+            source.valid.eq(sink.valid),
+            source.data.eq(sink.data),
+            sink.ready.eq(source.ready),
+            If(source.valid & source.ready & sink.last,
+                NextState("INSERT_HEADER")
+            )
+        )
+
+
+class USBAggregator(Module):
+    def __init__(self, max_length=2048, depth=1024):
+        self.sink = sink = stream.Endpoint(user_description(32))
+        self.source = source = stream.Endpoint(user_description(32))
+
+        # # #
+
+        # Aggregates the consecutive packets of a port in a single USB packet (max_length bytes),
+        # each packet is preceded by a 1 dword sub-header giving its length in bytes:
+        #   - sub-header : 4 bytes (length)
+        #   - payload
+        # Packets are stored in the fifo and the aggregated packet is sent when the sink is idle
+        # between packets or when the next packet would not fit. A packet that can't fit in an
+        # aggregated packet (4 + length > max_length) is sent alone with its sub-header once the
+        # pending packets are sent.
+        assert 4*depth >= max_length
+        fifo = stream.SyncFIFO(phy_description(32), depth, buffered=True)
+        self.submodules += fifo
+
+        dst = Signal(8)
+        sub_header = Signal(reset=1)
+        available = Signal(max=max_length + 1)
+        fits = Signal()
+        oversized = Signal()
+        add = Signal()
+        take = Signal()
+
+        self.comb += [
+            fits.eq(available + 4 + sink.length <= max_length),
+            oversized.eq(4 + sink.length > max_length),
+            If(sub_header,
+                fifo.sink.valid.eq(sink.valid & fits),
+                fifo.sink.data.eq(sink.length)
+            ).Else(
+                fifo.sink.valid.eq(sink.valid),
+                fifo.sink.data.eq(sink.data),
+                sink.ready.eq(fifo.sink.ready)
+            ),
+            add.eq(fifo.sink.valid & fifo.sink.ready & ~sub_header & sink.last)
+        ]
+        self.sync += [
+            If(fifo.sink.valid & fifo.sink.ready,
+                dst.eq(sink.dst),
+                If(sub_header,
+                    sub_header.eq(0)
+                ).Elif(sink.last,
+                    sub_header.eq(1)
+                )
+            ),
+            If(take,
+                available.eq(Mux(add, 4 + sink.length, 0))
+            ).Elif(add,
+                available.eq(available + 4 + sink.length)
+            )
+        ]
+
+        length = Signal(max=max_length + 1)
+        count = Signal(max=max_length//4 + 1)
 
         fsm = FSM(reset_state="IDLE")
         self.submodules += fsm
 
         fsm.act("IDLE",
-            If(sink.valid,
-                NextState("INSERT_HEADER")
+            If((available != 0) & sub_header & (~sink.valid | ~fits),
+                take.eq(1),
+                NextValue(length, available),
+                NextValue(count, 0),
+                NextState("SEND")
+            ).Elif((available == 0) & sub_header & sink.valid & oversized,
+                NextState("BYPASS_SUB_HEADER")
             )
         )
-
-        fsm.act("INSERT_HEADER",
-            header_unpack.sink.valid.eq(1),
+        fsm.act("BYPASS_SUB_HEADER",
             source.valid.eq(1),
-            source.data.eq(header_unpack.source.data),
-            header_unpack.source.ready.eq(source.ready),
-            If(header_unpack.sink.ready,
-                NextState("COPY")
+            source.dst.eq(sink.dst),
+            source.length.eq(4 + sink.length),
+            source.data.eq(sink.length),
+            If(source.ready,
+                NextState("BYPASS")
             )
         )
-
-        fsm.act("COPY",
+        fsm.act("BYPASS",
             source.valid.eq(sink.valid),
+            source.last.eq(sink.last),
+            source.dst.eq(sink.dst),
+            source.length.eq(4 + sink.length),
             source.data.eq(sink.data),
             sink.ready.eq(source.ready),
-            If(source.valid & source.ready & sink.last,
+            If(sink.valid & sink.ready & sink.last,
                 NextState("IDLE")
             )
         )
+        fsm.act("SEND",
+            source.valid.eq(fifo.source.valid),
+            source.last.eq(count == length[2:] - 1),
+            source.dst.eq(dst),
+            source.length.eq(length),
+            source.data.eq(fifo.source.data),
+            fifo.source.ready.eq(source.ready),
+            If(source.valid & source.ready,
+                NextValue(count, count + 1),
+                If(source.last,
+                    NextState("IDLE")
+                )
+            )
+        )
 
 
 class USBDepacketizer(Module):
@@ -127,6 +299,10 @@ class USBDepacketizer(Module):
         self.sink = sink = stream.Endpoint(phy_description(32))
         self.source = source = stream.Endpoint(user_description(32))
 
+        # telemetry
+        self.timeout = Signal() # packet aborted on timeout
+        self.resync  = Signal() # preamble found after discarded words
+
         # # #
 
         # Packet description
@@ -137,49 +313,58 @@ class USBDepacketizer(Module):
         #   - payload
         preamble = Signal(32)
 
+        # Header words are captured directly (no turnaround cycle between the header and the
+        # payload).
         header = [
             # dst
             source.dst,
             # length
             source.length
         ]
-
-        header_pack = ResetInserter()(stream.Pack(phy_description(32), len(header)))
-        self.submodules += header_pack
-
-        for i, byte in enumerate(header):
-            chunk = getattr(header_pack.source.payload, "chunk" + str(i))
-            self.comb += byte.eq(chunk.data)
+        header_count = Signal(max=len(header))
+        header_ce = Signal()
+        for i, field in enumerate(header):
+            self.sync += If(header_ce & (header_count == i), field.eq(sink.data))
 
         fsm = FSM(reset_state="IDLE")
         self.submodules += fsm
 
+        discarding = Signal()
+
         self.comb += preamble.eq(sink.data)
         fsm.act("IDLE",
             sink.ready.eq(1),
+            NextValue(header_count, 0),
             If((sink.data == 0x5aa55aa5) & sink.valid,
+                   self.resync.eq(discarding),
+                   NextValue(discarding, 0),
                    NextState("RECEIVE_HEADER")
-            ),
-            header_pack.source.ready.eq(1)
+            ).Elif(sink.valid,
+                NextValue(discarding, 1)
+            )
         )
 
         self.submodules.timer = WaitTimer(clk_freq*timeout)
-        self.comb += self.timer.wait.eq(~fsm.ongoing("IDLE"))
+        self.comb += [
+            self.timer.wait.eq(~fsm.ongoing("IDLE")),
+            self.timeout.eq(self.timer.done)
+        ]
 
         fsm.act("RECEIVE_HEADER",
-            header_pack.sink.valid.eq(sink.valid),
-            header_pack.sink.payload.eq(sink.payload),
             If(self.timer.done,
                 NextState("IDLE")
-            ).Elif(header_pack.source.valid,
-                NextState("COPY")
             ).Else(
-                sink.ready.eq(1)
+                sink.ready.eq(1),
+                If(sink.valid,
+                    header_ce.eq(1),
+                    NextValue(header_count, header_count + 1),
+                    If(header_count == len(header) - 1,
+                        NextState("COPY")
+                    )
+                )
             )
         )
 
-        self.comb += header_pack.reset.eq(self.timer.done)
-
         last = Signal()
         cnt = Signal(32)
 
@@ -203,16 +388,30 @@ class USBDepacketizer(Module):
 
 
 class USBCrossbar(Module):
-    def __init__(self):
+    def __init__(self, dw=32):
+        self.dw = dw
         self.users = OrderedDict()
-        self.master = USBMasterPort(32)
+        self.master = USBMasterPort(dw)
         self.dispatch_param = "dst"
 
-    def get_port(self, dst):
-        port = USBUserPort(32, dst)
+    def get_port(self, dst, dw=None):
+        port = USBUserPort(self.dw, dst)
         if dst in self.users.keys():
             raise ValueError("Destination {0:#x} already assigned".format(dst))
         self.users[dst] = port
+        if dw is not None and dw != self.dw:
+            # 32-bit user port on a wider crossbar.
+            user_port = USBUserPort(dw, dst)
+            up = USBUpConverter(self.dw)
+            down = USBDownConverter(self.dw)
+            self.submodules += up, down
+            self.comb += [
+                user_port.sink.connect(up.sink),
+                up.source.connect(port.sink),
+                port.source.connect(down.sink),
+                down.source.connect(user_port.source)
+            ]
+            return user_port
         return port
 
     def do_finalize(self):
@@ -234,7 +433,7 @@ class USBCrossbar(Module):
 
 
 class USBCore(Module):
-    def __init__(self, phy, clk_freq):
+    def __init__(self, phy, clk_freq, dw=32):
         rx_pipeline = [phy]
         tx_pipeline = [phy]
 
@@ -244,8 +443,16 @@ class USBCore(Module):
         rx_pipeline += [self.depacketizer]
         tx_pipeline += [self.packetizer]
 
+        # width converters: the crossbar and the user ports run at dw, the packets are only
+        # narrowed to the 32-bit FT601 words at the packetizer.
+        if dw != 32:
+            self.submodules.up_converter = USBUpConverter(dw)
+            self.submodules.down_converter = USBDownConverter(dw)
+            rx_pipeline += [self.up_converter]
+            tx_pipeline += [self.down_converter]
+
         # crossbar
-        self.submodules.crossbar = USBCrossbar()
+        self.submodules.crossbar = USBCrossbar(dw)
         rx_pipeline += [self.crossbar.master]
         tx_pipeline += [self.crossbar.master]
 
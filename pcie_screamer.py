@@ -15,6 +15,8 @@ from litex.soc.cores.clock import *
 from litex.soc.integration.soc_core import *
 from litex.soc.integration.builder import *
 from litex.soc.interconnect import stream
+from litex.soc.interconnect.packet import Arbiter
+from litex.soc.integration.soc import SoCRegion
 from litex.soc.cores.uart import UARTWishboneBridge
 from litex.soc.cores.usb_fifo import phy_description
 
@@ -23,6 +25,9 @@ from litepcie.phy.s7pciephy import S7PCIEPHY
 from gateware.usb import USBCore
 from gateware.etherbone import Etherbone
 from gateware.tlp import TLP
+from gateware.filter import TLPFilter
+from gateware.responder import TLPResponder
+from gateware.telemetry import Telemetry
 from gateware.msi import MSI
 from gateware.ft601 import FT601Sync
 
@@ -31,9 +36,13 @@ from litescope import LiteScopeAnalyzer
 # CRG ----------------------------------------------------------------------------------------------
 
 class _CRG(Module):
-    def __init__(self, platform, sys_clk_freq):
+    def __init__(self, platform, sys_clk_freq, with_dram=False):
         self.clock_domains.cd_sys = ClockDomain()
         self.clock_domains.cd_usb = ClockDomain()
+        if with_dram:
+            self.clock_domains.cd_sys4x     = ClockDomain(reset_less=True)
+            self.clock_domains.cd_sys4x_dqs = ClockDomain(reset_less=True)
+            self.clock_domains.cd_idelay    = ClockDomain()
 
         # # #
 
@@ -44,6 +53,13 @@ class _CRG(Module):
         pll.register_clkin(sys_clk_100, 100e6)
         pll.create_clkout(self.cd_sys, sys_clk_freq)
 
+        # dram
+        if with_dram:
+            pll.create_clkout(self.cd_sys4x,     4*sys_clk_freq)
+            pll.create_clkout(self.cd_sys4x_dqs, 4*sys_clk_freq, phase=90)
+            pll.create_clkout(self.cd_idelay,    200e6)
+            self.submodules.idelayctrl = S7IDELAYCTRL(self.cd_idelay)
+
         # usb
         usb_clk100 = platform.request("usb_fifo_clock")
         platform.add_period_constraint(usb_clk100, 1e9/100e6)
@@ -57,26 +73,60 @@ class PCIeScreamer(SoCMini):
         "wishbone": 0,
         "tlp":      1
     }
-
-    def __init__(self, platform, with_analyzer=True, with_loopback=False):
+    mem_map = {
+        "tlp_responder": 0x20000000
+    }
+    mem_map.update(SoCMini.mem_map)
+
+    def __init__(self, platform, with_analyzer=True, with_loopback=False, with_tlp_aggregation=False,
+        with_tlp_timestamp=False, with_tlp_filter=False, with_tlp_responder=False,
+        with_tlp_capture=False, with_telemetry=False,
+        usb_config=None, tlp_data_width=32, with_tlp_length=False,
+        crg=None, pcie_phy=None, usb_phy=None, with_uart_bridge=True):
+        # crg/pcie_phy/usb_phy replace the board ones (simulation, see pcie_screamer_sim.py).
         sys_clk_freq = int(100e6)
 
         # SoCMini ----------------------------------------------------------------------------------
         SoCMini.__init__(self, platform, sys_clk_freq, ident="PCIe Screamer", ident_version=True)
 
         # CRG --------------------------------------------------------------------------------------
-        self.submodules.crg = _CRG(platform, sys_clk_freq)
+        if crg is None:
+            crg = _CRG(platform, sys_clk_freq, with_dram=with_tlp_capture)
+        self.submodules.crg = crg
+
+        # DDR3 SDRAM -------------------------------------------------------------------------------
+        if with_tlp_capture:
+            # litedram is only required with the TLP capture.
+            from litedram.modules import MT41K128M16
+            from litedram.phy import s7ddrphy
+            self.submodules.ddrphy = s7ddrphy.A7DDRPHY(platform.request("ddram"),
+                memtype      = "DDR3",
+                nphases      = 4,
+                sys_clk_freq = sys_clk_freq)
+            self.add_csr("ddrphy")
+            sdram_module = MT41K128M16(sys_clk_freq, "1:4")
+            self.add_sdram("sdram",
+                phy    = self.ddrphy,
+                module = sdram_module,
+                origin = self.mem_map["main_ram"])
 
         # Serial Wishbone Bridge -------------------------------------------------------------------
-        self.submodules.bridge = UARTWishboneBridge(platform.request("serial"), sys_clk_freq, baudrate=3e6)
-        self.bus.add_master(master=self.bridge.wishbone)
+        if with_uart_bridge:
+            self.submodules.bridge = UARTWishboneBridge(platform.request("serial"), sys_clk_freq, baudrate=3e6)
+            self.bus.add_master(master=self.bridge.wishbone)
 
         # PCIe PHY ---------------------------------------------------------------------------------
-        self.submodules.pcie_phy = S7PCIEPHY(platform, platform.request("pcie_x1"))
+        if pcie_phy is None:
+            pcie_phy = S7PCIEPHY(platform, platform.request("pcie_x1"))
+        self.submodules.pcie_phy = pcie_phy
         self.add_csr("pcie_phy")
 
         # USB FT601 PHY ----------------------------------------------------------------------------
-        self.submodules.usb_phy = FT601Sync(platform.request("usb_fifo"), dw=32, timeout=1024)
+        if usb_phy is None:
+            usb_config = {} if usb_config is None else usb_config
+            usb_phy = FT601Sync(platform.request("usb_fifo"), dw=32, **usb_config)
+        self.submodules.usb_phy = usb_phy
+        self.add_csr("usb_phy")
 
         # USB Loopback -----------------------------------------------------------------------------
         if with_loopback:
@@ -87,18 +137,72 @@ class PCIeScreamer(SoCMini):
             ]
         # USB Core ---------------------------------------------------------------------------------
         else:
-            self.submodules.usb_core = USBCore(self.usb_phy, sys_clk_freq)
+            self.submodules.usb_core = USBCore(self.usb_phy, sys_clk_freq, dw=tlp_data_width)
 
             # USB <--> Wishbone --------------------------------------------------------------------
             self.submodules.etherbone = Etherbone(self.usb_core, self.usb_map["wishbone"])
             self.bus.add_master(master=self.etherbone.master.bus)
 
             # USB <--> TLP -------------------------------------------------------------------------
-            self.submodules.tlp = TLP(self.usb_core, self.usb_map["tlp"])
-            self.comb += [
-                self.pcie_phy.source.connect(self.tlp.sender.sink),
-                self.tlp.receiver.source.connect(self.pcie_phy.sink)
-            ]
+            self.submodules.tlp = TLP(self.usb_core, self.usb_map["tlp"],
+                with_aggregation = with_tlp_aggregation,
+                with_timestamp   = with_tlp_timestamp,
+                with_length      = with_tlp_length,
+                dw               = tlp_data_width)
+            self.add_csr("tlp")
+
+            # PCIe --> (Filter) --> (Responder) --> (Capture) --> USB
+            tlp_source = self.pcie_phy.source
+            if with_tlp_filter:
+                self.submodules.tlp_filter = TLPFilter()
+                self.add_csr("tlp_filter")
+                self.comb += tlp_source.connect(self.tlp_filter.sink)
+                tlp_source = self.tlp_filter.source
+            if with_tlp_responder:
+                self.submodules.tlp_responder = TLPResponder(self.pcie_phy.id)
+                self.add_csr("tlp_responder")
+                self.bus.add_slave("tlp_responder", self.tlp_responder.bus,
+                    SoCRegion(origin=self.mem_map["tlp_responder"], size=16*1024))
+                self.comb += tlp_source.connect(self.tlp_responder.sink)
+                tlp_source = self.tlp_responder.source
+            if with_tlp_capture:
+                from gateware.capture import TLPCapture
+                # the whole SDRAM is used as a FIFO of 64-bit beats, one per SDRAM word (after
+                # DDR3 init/calibration from the host, see test/test_sdram.py).
+                write_port = self.sdram.crossbar.get_port()
+                read_port  = self.sdram.crossbar.get_port()
+                sdram_size = 2**(sdram_module.geom_settings.bankbits +
+                                 sdram_module.geom_settings.rowbits +
+                                 sdram_module.geom_settings.colbits)*self.ddrphy.settings.databits//8
+                self.submodules.tlp_capture = TLPCapture(write_port, read_port,
+                    base  = 0,
+                    depth = sdram_size//(write_port.data_width//8))
+                self.add_csr("tlp_capture")
+                self.comb += tlp_source.connect(self.tlp_capture.sink)
+                tlp_source = self.tlp_capture.source
+            self.comb += tlp_source.connect(self.tlp.sender.sink)
+
+            # USB --> PCIe (+ Responder completions)
+            if with_tlp_responder:
+                self.submodules.tlp_arbiter = Arbiter(
+                    [self.tlp.receiver.source, self.tlp_responder.cpl_source],
+                    self.pcie_phy.sink)
+            else:
+                self.comb += self.tlp.receiver.source.connect(self.pcie_phy.sink)
+
+        # Telemetry --------------------------------------------------------------------------------
+        if with_telemetry:
+            self.submodules.telemetry = telemetry = Telemetry()
+            self.add_csr("telemetry")
+            telemetry.add_stream("pcie_rx", self.pcie_phy.source, 64) # PCIe --> USB
+            telemetry.add_stream("pcie_tx", self.pcie_phy.sink, 64)   # USB --> PCIe
+            telemetry.add_stream("usb_tx", self.usb_phy.sink, 32, with_packets=False)
+            telemetry.add_stream("usb_rx", self.usb_phy.source, 32, with_packets=False)
+            if not with_loopback:
+                telemetry.add_high_water_mark("tlp_buf_level",  self.tlp.sender.buf_level)
+                telemetry.add_high_water_mark("tlp_fifo_level", self.tlp.sender.fifo_level)
+                telemetry.add_event("usb_depacketizer_timeouts", self.usb_core.depacketizer.timeout)
+                telemetry.add_event("usb_depacketizer_resyncs",  self.usb_core.depacketizer.resync)
 
         # Wishbone --> MSI -------------------------------------------------------------------------
         self.submodules.msi = MSI()
@@ -130,17 +234,45 @@ def main():
     parser.add_argument("--m2",            action="store_true", help="use M2 variant of PCIe Screamer")
     parser.add_argument("--with-analyzer", action="store_true", help="enable Analyzer")
     parser.add_argument("--with-loopback", action="store_true", help="enable USB Loopback")
+    parser.add_argument("--with-tlp-aggregation", action="store_true", help="aggregate TLPs in USB packets with sub-headers")
+    parser.add_argument("--with-tlp-timestamp",   action="store_true", help="timestamp the TLPs sent over USB")
+    parser.add_argument("--with-tlp-length",      action="store_true", help="precede the TLPs sent over USB with their length")
+    parser.add_argument("--with-tlp-filter",      action="store_true", help="enable TLP filter before USB")
+    parser.add_argument("--with-tlp-responder",   action="store_true", help="answer MRds from a memory window in hardware")
+    parser.add_argument("--with-tlp-capture",     action="store_true", help="buffer the TLPs sent over USB in DDR3")
+    parser.add_argument("--with-telemetry",       action="store_true", help="enable traffic/drop counters")
+    parser.add_argument("--tlp-data-width",       default=32, type=int, choices=[32, 64], help="TLP FIFOs/USB crossbar data width")
+    parser.add_argument("--usb-timeout",           default=1024, type=int, help="FT601 read/write arbitration quantum on reset (cycles)")
+    parser.add_argument("--usb-read-fifo-depth",   default=128,  type=int, help="FT601 read (USB --> FPGA) CDC FIFO depth")
+    parser.add_argument("--usb-write-fifo-depth",  default=128,  type=int, help="FT601 write (FPGA --> USB) CDC FIFO depth")
+    parser.add_argument("--usb-read-buffer-depth", default=4,    type=int, help="FT601 read buffer depth")
+    parser.add_argument("--usb-deep-fifo-depth",   default=0,    type=int, help="FT601 BRAM FIFOs depth (0: disabled)")
+    parser.add_argument("--usb-adaptive",          action="store_true",    help="FT601 adaptive arbitration on reset (sniffing)")
     parser.add_argument("--build", action="store_true", help="Build bitstream")
     parser.add_argument("--load",  action="store_true", help="Load bitstream")
     parser.add_argument("--flash", action="store_true", help="Flash bitstream")
     args = parser.parse_args()
+    if args.with_tlp_aggregation and args.tlp_data_width != 32:
+        parser.error("--with-tlp-aggregation is only supported with --tlp-data-width 32")
 
     if args.m2:
         from platforms.pcie_screamer_m2 import Platform
     else:
         from platforms.pcie_screamer import Platform
     platform = Platform()
-    soc      = PCIeScreamer(platform, args.with_analyzer, args.with_loopback)
+    soc      = PCIeScreamer(platform, args.with_analyzer, args.with_loopback,
+        args.with_tlp_aggregation, args.with_tlp_timestamp, args.with_tlp_filter,
+        args.with_tlp_responder, args.with_tlp_capture, args.with_telemetry,
+        usb_config={
+            "timeout":           args.usb_timeout,
+            "read_fifo_depth":   args.usb_read_fifo_depth,
+            "write_fifo_depth":  args.usb_write_fifo_depth,
+            "read_buffer_depth": args.usb_read_buffer_depth,
+            "deep_fifo_depth":   args.usb_deep_fifo_depth,
+            "adaptive":          args.usb_adaptive,
+        },
+        tlp_data_width=args.tlp_data_width,
+        with_tlp_length=args.with_tlp_length)
     builder  = Builder(soc, csr_csv="test/csr.csv")
     builder.build(run=args.build)
 
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+
+# This file is Copyright (c) 2026 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import os
+import sys
+import time
+import struct
+import socket
+import argparse
+from collections import deque
+
+from migen import *
+from migen.sim import passive
+
+from litex.build.generic_platform import *
+from litex.build.sim import SimPlatform
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect.csr import *
+from litex.soc.integration.export import get_csr_csv
+from litex.soc.cores.usb_fifo import phy_description
+
+from litepcie.common import phy_layout, msi_layout
+
+from pcie_screamer import PCIeScreamer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "software"))
+from tlp import parse_dwords, ReadRequest, CPLD, CPL
+from ft60x import ft60x_ports, ft60x_preamble
+from transport import SimTarget, udp_ports
+
+# IOs ----------------------------------------------------------------------------------------------
+
+_io = [
+    ("sys_clk", 0, Pins(1)),
+    ("sys_rst", 0, Pins(1)),
+    ("user_led", 0, Pins(1)),
+    ("user_led", 1, Pins(1)),
+]
+
+# Platform -----------------------------------------------------------------------------------------
+
+class Platform(SimPlatform):
+    def __init__(self):
+        SimPlatform.__init__(self, "SIM", _io)
+
+# CRG ----------------------------------------------------------------------------------------------
+
+class _CRG(Module):
+    # clocks/resets are generated by the simulator.
+    def __init__(self):
+        self.clock_domains.cd_sys  = ClockDomain()
+        self.clock_domains.cd_usb  = ClockDomain()
+        self.clock_domains.cd_pcie = ClockDomain()
+
+# PHY models ---------------------------------------------------------------------------------------
+
+class PCIEPHYModel(Module, AutoCSR):
+    # Stream-level S7PCIEPHY: the TLPs are exchanged with pcie_host() as 64-bit beats (sys
+    # domain), the status CSRs report a trained link.
+    def __init__(self, data_width=64, id=0x0100, max_request_size=512, max_payload_size=128):
+        self.sink   = stream.Endpoint(phy_layout(data_width))
+        self.source = stream.Endpoint(phy_layout(data_width))
+        self.msi    = stream.Endpoint(msi_layout())
+        self.data_width = data_width
+        self.id = Signal(16, reset=id)
+
+        self._lnk_up            = CSRStatus(reset=1)
+        self._msi_enable        = CSRStatus(reset=1)
+        self._bus_master_enable = CSRStatus(reset=1)
+        self._max_request_size  = CSRStatus(16, reset=max_request_size)
+        self._max_payload_size  = CSRStatus(16, reset=max_payload_size)
+
+
+class USBPHYModel(Module):
+    # Stream-level FT601Sync: the 32-bit words of the FT601 are exchanged with usb_host() (sys
+    # domain).
+    def __init__(self, dw=32):
+        self.sink   = stream.Endpoint(phy_description(dw))
+        self.source = stream.Endpoint(phy_description(dw))
+
+# PCIe host model ----------------------------------------------------------------------------------
+
+def tlp_beats(data):
+    # 64-bit beats (dat, be, last) of a TLP.
+    dwords = struct.unpack("<{}I".format(len(data)//4), data)
+    beats = []
+    for i in range(0, len(dwords), 2):
+        if i + 1 < len(dwords):
+            beats.append((dwords[i] | (dwords[i + 1] << 32), 0xff, 0))
+        else:
+            beats.append((dwords[i], 0x0f, 0))
+    dat, be, last = beats[-1]
+    beats[-1] = (dat, be, 1)
+    return beats
+
+
+@passive
+def pcie_host(phy, target, stats, read_period=0, read_address=0):
+    # The TLPs sent by the FPGA are handled by a SimTarget (host memory image answering RD32s
+    # with CPLDs, WR32s written to the image). With read_period, the host also reads a dword at
+    # read_address every read_period cycles (TLPs forwarded to the USB host, see injector.py).
+    queue = target.queues.setdefault(ft60x_ports["tlp"], deque())
+    beats = deque()
+    dwords = []
+    cycle = 0
+    tag = 0
+    yield phy.sink.ready.eq(1)
+    yield phy.msi.ready.eq(1)
+    while True:
+        if read_period and cycle%read_period == 0:
+            request = ReadRequest(read_address, 1, tag, requester_id=0x0000)
+            queue.append(struct.pack("<3I", *request.encode_dwords()))
+            tag = (tag + 1)%32
+            stats["host_reads"] += 1
+        if not len(beats) and len(queue):
+            beats.extend(tlp_beats(queue.popleft()))
+        if len(beats):
+            dat, be, last = beats[0]
+            yield phy.source.valid.eq(1)
+            yield phy.source.dat.eq(dat)
+            yield phy.source.be.eq(be)
+            yield phy.source.last.eq(last)
+        else:
+            yield phy.source.valid.eq(0)
+        yield
+        cycle += 1
+        if (yield phy.source.valid) and (yield phy.source.ready):
+            beats.popleft()
+        if (yield phy.sink.valid):
+            dat = (yield phy.sink.dat)
+            dwords.append(dat & 0xffffffff)
+            if (yield phy.sink.be) & 0xf0:
+                dwords.append(dat >> 32)
+            if (yield phy.sink.last):
+                tlp, length = parse_dwords(dwords, 0)
+                if isinstance(tlp, (CPLD, CPL)) and tlp.requester_id == 0x0000:
+                    stats["host_completions"] += 1
+                target.handle(ft60x_ports["tlp"], struct.pack("<{}I".format(len(dwords)), *dwords))
+                dwords = []
+        if (yield phy.msi.valid):
+            stats["msis"] += 1
+
+# USB host model -----------------------------------------------------------------------------------
+
+class UDPBridge:
+    # Same as usb2udp: one UDP socket per USB port of the gateware crossbar, the datagrams are
+    # sent to the port with the USB header and the USB packets of a port are sent to the last
+    # client of its socket.
+    def __init__(self, address="127.0.0.1"):
+        self.sockets = {}
+        self.clients = {}
+        for name, udp_port in udp_ports.items():
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((address, udp_port))
+            s.setblocking(False)
+            self.sockets[ft60x_ports[name]] = s
+            print("new bridge: usb_port[{}] <--> udp_port[{}]".format(ft60x_ports[name], udp_port))
+
+    def recv(self):
+        packets = []
+        for port, s in self.sockets.items():
+            while True:
+                try:
+                    data, client = s.recvfrom(2**16)
+                except BlockingIOError:
+                    break
+                self.clients[port] = client
+                packets.append((port, data))
+        return packets
+
+    def send(self, port, data):
+        if port in self.clients:
+            self.sockets[port].sendto(data, self.clients[port])
+
+
+def usb_words(port, data):
+    # USB packet: preamble, port, length (bytes), data padded to 32-bit words.
+    data = bytes(data) + bytes(-len(data)%4)
+    return [ft60x_preamble, port, len(data)] + list(struct.unpack("<{}I".format(len(data)//4), data))
+
+
+@passive
+def usb_host(phy, bridge, stats, poll_period=64):
+    tx = deque()
+    rx = []
+    cycle = 0
+    yield phy.sink.ready.eq(1)
+    while True:
+        if cycle%poll_period == 0:
+            for port, data in bridge.recv():
+                tx.extend(usb_words(port, data))
+                stats["udp_rx"] += 1
+        if len(tx):
+            yield phy.source.valid.eq(1)
+            yield phy.source.data.eq(tx[0])
+        else:
+            yield phy.source.valid.eq(0)
+        yield
+        cycle += 1
+        if (yield phy.source.valid) and (yield phy.source.ready):
+            tx.popleft()
+        if (yield phy.sink.valid):
+            rx.append((yield phy.sink.data))
+            # resynchronize on the preamble, then wait for the whole packet.
+            while len(rx) and rx[0] != ft60x_preamble:
+                rx.pop(0)
+            if len(rx) >= 3 and len(rx) >= 3 + (rx[2] + 3)//4:
+                port, length = rx[1], rx[2]
+                n = (length + 3)//4
+                data = struct.pack("<{}I".format(n), *rx[3:3 + n])[:length]
+                bridge.send(port, data)
+                stats["udp_tx"] += 1
+                rx = rx[3 + n:]
+
+# Run ----------------------------------------------------------------------------------------------
+
+def run_cycles(cycles, stats, report_period=10000):
+    cycle = 0
+    start = time.time()
+    while cycles == 0 or cycle < cycles:
+        yield
+        cycle += 1
+        if cycle%report_period == 0:
+            print("{:d} cycles ({:.0f} cycles/s) ".format(cycle, cycle/(time.time() - start)) +
+                " ".join("{}={}".format(k, v) for k, v in stats.items()))
+            sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PCIe Screamer simulation (PCIe/USB PHY models, usb2udp ports)")
+    parser.add_argument("--with-tlp-aggregation", action="store_true", help="aggregate TLPs in USB packets with sub-headers")
+    parser.add_argument("--with-tlp-timestamp",   action="store_true", help="timestamp the TLPs sent over USB")
+    parser.add_argument("--with-tlp-length",      action="store_true", help="precede the TLPs sent over USB with their length")
+    parser.add_argument("--with-tlp-filter",      action="store_true", help="enable TLP filter before USB")
+    parser.add_argument("--with-tlp-responder",   action="store_true", help="answer MRds from a memory window in hardware")
+    parser.add_argument("--with-telemetry",       action="store_true", help="enable traffic/drop counters")
+    parser.add_argument("--tlp-data-width",       default=32, type=int, choices=[32, 64], help="TLP FIFOs/USB crossbar data width")
+    parser.add_argument("--memory",            default=None,               help="host memory image (default: 1MB of zeros)")
+    parser.add_argument("--memory-base",       default="0",                help="host memory image address (hex)")
+    parser.add_argument("--max-request-size",  default=512, type=int,      help="PCIe max_request_size (bytes)")
+    parser.add_argument("--max-payload-size",  default=128, type=int,      help="PCIe max_payload_size (bytes)")
+    parser.add_argument("--host-read-period",  default=0,   type=int,      help="host dword reads to the FPGA period (cycles, 0: disabled)")
+    parser.add_argument("--host-read-address", default="0", help="host dword reads address (hex)")
+    parser.add_argument("--udp-address",       default="127.0.0.1",        help="UDP bridge address")
+    parser.add_argument("--cycles",            default=0,   type=int,      help="cycles to simulate (0: infinite)")
+    parser.add_argument("--csr-csv",           default="test/csr.csv",     help="CSR definitions output")
+    args = parser.parse_args()
+    if args.with_tlp_aggregation and args.tlp_data_width != 32:
+        parser.error("--with-tlp-aggregation is only supported with --tlp-data-width 32")
+
+    platform = Platform()
+    soc = PCIeScreamer(platform,
+        with_analyzer        = False,
+        with_tlp_aggregation = args.with_tlp_aggregation,
+        with_tlp_timestamp   = args.with_tlp_timestamp,
+        with_tlp_length      = args.with_tlp_length,
+        with_tlp_filter      = args.with_tlp_filter,
+        with_tlp_responder   = args.with_tlp_responder,
+        with_telemetry       = args.with_telemetry,
+        tlp_data_width       = args.tlp_data_width,
+        crg                  = _CRG(),
+        pcie_phy             = PCIEPHYModel(
+            max_request_size = args.max_request_size,
+            max_payload_size = args.max_payload_size),
+        usb_phy              = USBPHYModel(),
+        with_uart_bridge     = False)
+    soc.finalize()
+    with open(args.csr_csv, "w") as f:
+        f.write(get_csr_csv(soc.csr_regions, soc.constants, soc.mem_regions))
+
+    memory = None
+    if args.memory is not None:
+        with open(args.memory, "rb") as f:
+            memory = f.read()
+    target = SimTarget(memory,
+        base             = int(args.memory_base, 16),
+        max_payload_size = args.max_payload_size,
+        completer_id     = 0x0000)
+    bridge = UDPBridge(args.udp_address)
+
+    stats = {k: 0 for k in ["udp_rx", "udp_tx", "host_reads", "host_completions", "msis"]}
+    generators = {
+        "sys": [
+            run_cycles(args.cycles, stats),
+            pcie_host(soc.pcie_phy, target, stats, args.host_read_period, int(args.host_read_address, 16)),
+            usb_host(soc.usb_phy, bridge, stats),
+        ]
+    }
+    run_simulation(soc, generators, clocks={"sys": 10, "usb": 10, "pcie": 8})
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+import argparse
+
+import numpy as np
+
+from litepcie.core.tlp import common as tlp_common
+
+from tlp import *
+
+# Layout -------------------------------------------------------------------------------------------
+
+def _field_dtype(width):
+    for dtype, bits in [(np.uint8, 8), (np.uint16, 16), (np.uint32, 32)]:
+        if width <= bits:
+            return dtype
+    return np.uint64
+
+# Fields decoded for every TLP: request fields are used for requests, completion fields for
+# completions (fields present in both headers are decoded from the matching one).
+capture_fields = {}
+for header in [tlp_request_header, tlp_completion_header]:
+    for name, field in header.fields.items():
+        capture_fields.setdefault(name, field.width)
+
+capture_dtype = np.dtype([
+    ("offset",      np.uint64), # Dword offset of the TLP in the capture.
+    ("timestamp",   np.uint64), # Hardware timestamp (--with-tlp-timestamp gateware, else 0).
+    ("dwords",      np.uint32), # TLP size in dwords (header + payload).
+    ("fmt_type",    np.uint8),
+    ("data_offset", np.uint64), # Dword offset of the payload in the capture.
+    ("data_length", np.uint32), # Payload size in dwords.
+] + [(name, _field_dtype(width)) for name, width in capture_fields.items()])
+
+cpl_type = tlp_common.fmt_type_dict["cpl"] & type_mask
+
+# Helpers ------------------------------------------------------------------------------------------
+
+def to_dwords(data):
+    if isinstance(data, np.ndarray):
+        return data.astype("<u4", copy=False).reshape(-1)
+    return np.frombuffer(data, dtype="<u4", count=len(memoryview(data).cast("B"))//4)
+
+
+def get_tlp_lengths(dwords):
+    # Header/payload sizes of the TLP starting at each dword, assuming a header starts there:
+    # fmt[0] selects 3DW/4DW headers, fmt[1] the presence of a payload (length 0 is 1024 dwords).
+    length_field  = tlp_request_header.fields["length"]
+    fmt           = (dwords >> fmt_shift) & fmt_mask
+    length        = (dwords >> length_field.offset) & (2**length_field.width-1)
+    length        = np.where(length == 0, 2**length_field.width, length)
+    header_length = 3 + (fmt & 0b01)
+    data_length   = np.where(fmt & 0b10, length, 0)
+    return header_length.astype(np.int64), data_length.astype(np.int64)
+
+
+def get_tlp_starts(lengths):
+    # TLP boundaries form a chain (next = start + length) that we follow from dword 0 with
+    # pointer doubling: after k passes, every TLP start within 2**k hops is marked, so the whole
+    # chain is found in log2(n) vectorized passes.
+    n    = len(lengths)
+    jump = np.minimum(np.arange(n, dtype=np.int64) + lengths, n)
+    jump = np.append(jump, n)
+    mark = np.zeros(n + 1, dtype=bool)
+    mark[0] = True
+    while True:
+        mark[jump[np.flatnonzero(mark)]] = True
+        if jump[0] == n:
+            break
+        jump = jump[jump]
+    return np.flatnonzero(mark[:n])
+
+# Parser -------------------------------------------------------------------------------------------
+
+# Returns a structured array (capture_dtype) with the decoded header fields and payload offsets
+# of the complete TLPs of the capture, and the number of dwords consumed (a TLP truncated at the
+# end of the capture is left unconsumed). With timestamp, each TLP is preceded by its 64-bit
+# hardware timestamp. With length, each TLP (and timestamp) is preceded by its length in dwords:
+# the TLPs are framed by these lengths and only their headers are decoded.
+def parse_capture(data, offset=0, timestamp=False, length=False):
+    dwords = to_dwords(data)
+    n      = len(dwords)
+    if n == 0:
+        return np.zeros(0, dtype=capture_dtype), 0
+
+    if length:
+        lengths = length_prefix_length + (dwords & length_prefix_mask).astype(np.int64)
+        starts  = get_tlp_starts(lengths)
+        prefix  = length_prefix_length + (timestamp_length if timestamp else 0)
+        header_lengths = np.zeros(n, dtype=np.int64)
+        data_lengths   = np.zeros(n, dtype=np.int64)
+        header_lengths[starts], data_lengths[starts] = get_tlp_lengths(dwords[np.minimum(starts + prefix, n - 1)])
+    else:
+        prefix = timestamp_length if timestamp else 0
+        header_lengths, data_lengths = get_tlp_lengths(np.append(dwords[prefix:], np.zeros(prefix, dtype=dwords.dtype)))
+        lengths = prefix + header_lengths + data_lengths
+        starts  = get_tlp_starts(lengths)
+
+    # Drop TLP truncated at the end of the capture.
+    complete = (starts + lengths[starts]) <= n
+    consumed = n if complete.all() else int(starts[~complete][0])
+    starts   = starts[complete]
+
+    tlps = np.zeros(len(starts), dtype=capture_dtype)
+    tlps["offset"]      = starts + prefix + offset
+    tlps["dwords"]      = lengths[starts] - prefix
+    tlps["data_offset"] = starts + prefix + header_lengths[starts] + offset
+    tlps["data_length"] = data_lengths[starts]
+    if timestamp:
+        ts = starts + prefix - timestamp_length
+        tlps["timestamp"] = dwords[ts].astype(np.uint64) | (dwords[ts + 1].astype(np.uint64) << np.uint64(32))
+
+    header     = [dwords[np.minimum(starts + prefix + i, n - 1)] for i in range(3)]
+    tlps["fmt_type"] = (((header[0] >> fmt_shift) & fmt_mask) << 5) | ((header[0] >> type_shift) & type_mask)
+    completion = (tlps["fmt_type"] & type_mask) == cpl_type
+
+    for name in capture_fields.keys():
+        values = {}
+        for header_type, fields in [("request", tlp_request_header.fields), ("completion", tlp_completion_header.fields)]:
+            if name in fields:
+                field = fields[name]
+                mask  = 2**field.width-1
+                values[header_type] = (header[field.byte//4].astype(np.uint64) >> field.offset) & mask
+        if len(values) == 2:
+            tlps[name] = np.where(completion, values["completion"], values["request"])
+        elif "request" in values:
+            tlps[name] = np.where(completion, 0, values["request"])
+        else:
+            tlps[name] = np.where(completion, values["completion"], 0)
+
+    return tlps, consumed
+
+
+def parse_capture_file(filename, chunk_size=2**22, timestamp=False, length=False):
+    dwords = np.memmap(filename, dtype="<u4", mode="r")
+    position = 0
+    while position < len(dwords):
+        tlps, consumed = parse_capture(dwords[position:position + chunk_size], offset=position,
+            timestamp=timestamp, length=length)
+        if consumed == 0:
+            break
+        position += consumed
+        yield tlps
+
+# Main ---------------------------------------------------------------------------------------------
+
+fmt_type_names = {v: k for k, v in tlp_common.fmt_type_dict.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="PCIe Screamer TLP capture parser")
+    parser.add_argument("filename",                                help="capture file (little-endian dwords)")
+    parser.add_argument("--chunk-size", default=2**22, type=int,   help="dwords parsed per chunk")
+    parser.add_argument("--with-tlp-timestamp", action="store_true", help="capture from a --with-tlp-timestamp gateware")
+    parser.add_argument("--with-tlp-length",    action="store_true", help="capture from a --with-tlp-length gateware")
+    args = parser.parse_args()
+
+    count  = 0
+    counts = {}
+    first  = None
+    last   = None
+    for tlps in parse_capture_file(args.filename, args.chunk_size, args.with_tlp_timestamp, args.with_tlp_length):
+        count += len(tlps)
+        if len(tlps):
+            first = tlps["timestamp"][0] if first is None else first
+            last  = tlps["timestamp"][-1]
+        fmt_types, fmt_type_counts = np.unique(tlps["fmt_type"], return_counts=True)
+        for fmt_type, fmt_type_count in zip(fmt_types, fmt_type_counts):
+            counts[int(fmt_type)] = counts.get(int(fmt_type), 0) + int(fmt_type_count)
+    print("TLPs: {}".format(count))
+    if args.with_tlp_timestamp and first is not None:
+        print("Duration: {} cycles".format(int(last - first)))
+    for fmt_type, fmt_type_count in sorted(counts.items()):
+        name = fmt_type_names.get(fmt_type, "0x{:02x}".format(fmt_type))
+        print("  {:<10s}: {}".format(name, fmt_type_count))
+
+if __name__ == "__main__":
+    main()
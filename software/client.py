@@ -0,0 +1,184 @@
+import time
+import struct
+import asyncio
+import threading
+
+from tlp import *
+from ringbuffer import RingBuffer
+from transport import UDPTransport, open_transport
+
+
+class TLPClient:
+    # asyncio TLP client: reads/writes can be issued concurrently from several tasks, reads
+    # share a pool of tags (up to 'outstanding' MRds in flight) and completions are dispatched
+    # to their request by tag. TLPs that do not complete a read (requests from the target,
+    # unexpected completions) are queued for the tlps() iterator. The datagrams are exchanged
+    # over a transport of transport.py (default: usb2udp at ip/port) and received in place in
+    # the ring buffer: by a reader task (sock_recv_into) with usb2udp, by a reader thread with
+    # the blocking transports (ft60x, sim).
+    def __init__(self, ip="127.0.0.1", port=2345, outstanding=32, max_request_size=128,
+        max_payload_size=128, requester_id=0x100, queue_size=4096, transport=None,
+        with_tlp_aggregation=False, with_tlp_timestamp=False, with_tlp_length=False):
+        assert 1 <= outstanding <= 32 # 5-bit tags (no extended tags).
+        self.ip = ip
+        self.port = port
+        self.transport = UDPTransport(ip, port) if transport is None else transport
+        self.with_tlp_aggregation = with_tlp_aggregation
+        self.outstanding = outstanding
+        self.max_request_size = max_request_size
+        self.max_payload_size = max_payload_size
+        self.requester_id = requester_id
+        self.queue_size = queue_size
+        self.buffer = RingBuffer(timestamp=with_tlp_timestamp, length=with_tlp_length)
+        self.reader = None
+        self.error = None
+        self.dropped = 0
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self.tags = asyncio.Queue()
+        for tag in range(self.outstanding):
+            self.tags.put_nowait(tag)
+        self.pending = {}
+        self.queue = asyncio.Queue(self.queue_size)
+        if isinstance(self.transport, UDPTransport):
+            self.transport.socket.setblocking(False)
+            # register to the bridge.
+            self.transport.send(bytes([0]))
+            self.reader = loop.create_task(self.read_socket())
+        else:
+            self.reader = threading.Thread(target=self.read_stream, args=(loop,), daemon=True)
+            self.reader.start()
+
+    async def read_socket(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                n = await loop.sock_recv_into(self.transport.socket, self.buffer.reserve())
+            except OSError as e:
+                self.error = e
+                break
+            self.buffer.commit(n, self.with_tlp_aggregation)
+            self.dispatch(list(self.buffer.tlps()))
+
+    def read_stream(self, loop):
+        # the ring buffer is only accessed by this thread, the TLPs are dispatched by the loop.
+        while self.reader is not None:
+            try:
+                self.buffer.recv_into(self.transport, self.with_tlp_aggregation)
+            except TimeoutError: # nothing received (sim)
+                time.sleep(1e-3)
+                continue
+            except OSError as e:
+                self.error = e
+                break
+            tlps = list(self.buffer.tlps())
+            if len(tlps):
+                loop.call_soon_threadsafe(self.dispatch, tlps)
+
+    def close(self):
+        if self.reader is not None:
+            reader = self.reader
+            self.reader = None
+            if isinstance(reader, asyncio.Task):
+                reader.cancel()
+            self.transport.close()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def send(self, dwords):
+        self.transport.send(struct.pack("<{}I".format(len(dwords)), *dwords))
+
+    def dispatch(self, tlps):
+        for tlp in tlps:
+            if isinstance(tlp, (CPLD, CPL)) and tlp.tag in self.pending:
+                request, future = self.pending[tlp.tag]
+                if request.complete(tlp):
+                    if request.done:
+                        self.release(request.tag)
+                        if not future.done():
+                            future.set_result(request.datas)
+                    continue
+            try:
+                self.queue.put_nowait(tlp)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    def release(self, tag):
+        del self.pending[tag]
+        self.tags.put_nowait(tag)
+
+    async def issue(self, request):
+        request.tag = await self.tags.get()
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request.tag] = (request, future)
+        self.send(request.encode_dwords())
+        return future
+
+    async def read(self, address, length=None, timeout=None):
+        length_int = 1 if length is None else length
+        requests = [ReadRequest(address, length, tag=None, requester_id=self.requester_id)
+            for address, length in split_read(address, length_int, self.max_request_size)]
+        futures = []
+        try:
+            for request in requests:
+                futures.append(await self.issue(request))
+            await asyncio.wait_for(asyncio.gather(*futures), timeout)
+        finally:
+            # free the tags of requests that did not complete (timeout/cancellation).
+            for request in requests:
+                if request.tag in self.pending and self.pending[request.tag][0] is request:
+                    self.release(request.tag)
+        datas = []
+        for future in futures:
+            datas += future.result()
+        return datas[0] if length is None else datas
+
+    async def write(self, address, datas):
+        datas = datas if isinstance(datas, list) else [datas]
+        offset = 0
+        for address, length in split_read(address, len(datas), self.max_payload_size):
+            wr = WR32()
+            wr.fmt = 0b10
+            wr.type = 0b00000
+            wr.length = length
+            wr.first_be = 0xf
+            wr.last_be = 0xf if length > 1 else 0x0
+            wr.address = address//4
+            wr.requester_id = self.requester_id
+            self.send(wr.encode_dwords(datas[offset:offset + length]))
+            offset += length
+
+    async def tlps(self):
+        while True:
+            yield await self.queue.get()
+
+
+def open_client(name="udp", cls=TLPClient, **kwargs):
+    # TLP client on a transport named as in transport.open_transport.
+    return cls(transport=open_transport(name, "tlp"), **kwargs)
+
+
+class SyncTLPClient:
+    # Blocking wrapper around TLPClient for scripts.
+    def __init__(self, *args, **kwargs):
+        self.loop = asyncio.new_event_loop()
+        self.client = TLPClient(*args, **kwargs)
+        self.loop.run_until_complete(self.client.open())
+
+    def read(self, address, length=None, timeout=None):
+        return self.loop.run_until_complete(self.client.read(address, length, timeout))
+
+    def write(self, address, datas):
+        return self.loop.run_until_complete(self.client.write(address, datas))
+
+    def close(self):
+        self.client.close()
+        # let the cancelled reader task finish.
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
@@ -1,56 +1,95 @@
-import socket
-import sys
+#!/usr/bin/env python3
 
-from tlp import *
+import argparse
+
+from transport import open_transport
+from client import SyncTLPClient
+
+
+max_request_sizes = [128, 256, 512, 1024, 2048, 4096]
+
+
+def read_max_request_size(csr_csv, transport):
+    # negotiated max_request_size read over Etherbone, None when it can't be read.
+    from etherbone import Etherbone
+    try:
+        etherbone = Etherbone(csr_csv, transport=open_transport(transport, "wishbone"))
+        max_request_size = etherbone.regs.pcie_phy_max_request_size.read()
+    except Exception as e:
+        print("can't read max_request_size ({})".format(e))
+        return None
+    if max_request_size not in max_request_sizes:
+        print("invalid max_request_size ({})".format(max_request_size))
+        return None
+    return max_request_size
 
 
 class Dump:
-    def __init__(self, ip="127.0.0.1", port=2345):
-        self.ip = ip
-        self.port = port
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-
-    def read(self, address):
-        # send rd32
-        rd = RD32()
-        rd.fmt = 0b00
-        rd.type = 0b00000
-        rd.length = 1
-        rd.first_be = 0xf
-        rd.address = address//4
-        rd.requester_id = 0x100
-        rd.encode_dwords()
-        packet = bytes()
-        for dword in rd.dwords:
-            packet += dword.to_bytes(4, byteorder="little")
-        self.socket.sendto(packet, (self.ip, self.port))
-
-        dwords = []
-        while True:
-            # receive dwords
-            data, addr = self.socket.recvfrom(1024)
-            for i in range(len(data)//4):
-                dword = int.from_bytes(data[4*i:4*(i+1)], byteorder="little")
-                dwords.append(dword)
-            # extract tlps
-            while len(dwords):
-                tlp, length = parse_dwords(dwords)
-                if tlp is None:
-                    break
-                else:
-                    if isinstance(tlp, CPLD):
-                        return tlp.data[0]
-                dwords = dwords[length:]
+    # Blocking host memory reads (SyncTLPClient): reads are split in max_request_size requests,
+    # up to outstanding requests in flight (each with its own tag), the completions are
+    # reassembled using their tag/byte_count/lower_address.
+    def __init__(self, ip="127.0.0.1", port=2345, outstanding=8, max_request_size=128, transport=None,
+        with_tlp_aggregation=False, with_tlp_timestamp=False, with_tlp_length=False):
+        assert 1 <= outstanding <= 32 # 5-bit tags (no extended tags).
+        assert max_request_size in max_request_sizes
+        self.client = SyncTLPClient(ip, port,
+            outstanding          = outstanding,
+            max_request_size     = max_request_size,
+            transport            = transport,
+            with_tlp_aggregation = with_tlp_aggregation,
+            with_tlp_timestamp   = with_tlp_timestamp,
+            with_tlp_length      = with_tlp_length)
 
+    def read(self, address, length=None):
+        return self.client.read(address, length)
 
-if __name__ == '__main__':
-    dump = Dump()
-    address = int(sys.argv[1], 16)
-    length = int(sys.argv[2])
+    def close(self):
+        self.client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PCIe Screamer host memory dump")
+    parser.add_argument("address",                                 help="start address (hex)")
+    parser.add_argument("length",                                  help="number of dwords")
+    parser.add_argument("--outstanding",      default=8,   type=int, help="maximum number of reads in flight (1-32)")
+    parser.add_argument("--max-request-size", default="128",            help="read request size in bytes or auto (negotiated max_request_size, read over Etherbone)")
+    parser.add_argument("--csr-csv",          default="../test/csr.csv", help="CSR definitions used with --max-request-size auto")
+    parser.add_argument("--transport",        default="udp",            help="udp[:ip] (usb2udp), ft60x[:device] or sim")
+    parser.add_argument("--with-tlp-aggregation", action="store_true",   help="gateware built with --with-tlp-aggregation")
+    parser.add_argument("--with-tlp-timestamp",   action="store_true",   help="gateware built with --with-tlp-timestamp")
+    parser.add_argument("--with-tlp-length",      action="store_true",   help="gateware built with --with-tlp-length")
+    args = parser.parse_args()
+
+    if not 1 <= args.outstanding <= 32: # 5-bit tags (no extended tags).
+        parser.error("--outstanding must be between 1 and 32")
+    if args.max_request_size == "auto":
+        max_request_size = read_max_request_size(args.csr_csv, args.transport)
+        if max_request_size is None:
+            max_request_size = 128
+            print("using max_request_size={}".format(max_request_size))
+    else:
+        try:
+            max_request_size = int(args.max_request_size)
+        except ValueError:
+            max_request_size = None
+        if max_request_size not in max_request_sizes:
+            parser.error("--max-request-size must be auto or one of {}".format(max_request_sizes))
+
+    dump = Dump(outstanding=args.outstanding, max_request_size=max_request_size,
+        transport=open_transport(args.transport, "tlp"),
+        with_tlp_aggregation=args.with_tlp_aggregation,
+        with_tlp_timestamp=args.with_tlp_timestamp,
+        with_tlp_length=args.with_tlp_length)
+    address = int(args.address, 16)
+    length = int(args.length)
+    datas = dump.read(address, length)
+    dump.close()
     for i in range(length):
         if i%4 == 0:
             print("0x%08x: " %(address + 4*i), end="")
-        data = dump.read(address + 4*i)
-        print("%08x " %data, end="")
+        print("%08x " %datas[i], end="")
         if i%4 == 3:
             print(" ")
+
+if __name__ == '__main__':
+    main()
@@ -1,51 +1,86 @@
-import socket
-
 from litex.soc.tools.remote.etherbone import *
 from litex.soc.tools.remote.csr_builder import CSRBuilder
 
+from transport import UDPTransport
+
+# Maximum number of reads/writes of a record (rcount/wcount are 8-bit).
+etherbone_max_count = 255
+
 
 class Etherbone(CSRBuilder):
-    def __init__(self, csr_csv=None, csr_data_width=32, debug=False):
+    # Accesses are coalesced in records of up to 255 reads/writes. The gateware only handles
+    # one record per packet, so records are sent in separate packets; up to max_inflight read
+    # packets are kept in flight and their replies are matched with base_ret_addr.
+    def __init__(self, csr_csv=None, csr_data_width=32, debug=False, max_inflight=4, transport=None):
         if csr_csv is not None:
             CSRBuilder.__init__(self, self, csr_csv, csr_data_width)
         self.debug = debug
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.max_inflight = max_inflight
+        self.transport = UDPTransport("127.0.0.1", 1234) if transport is None else transport
 
-    def read(self, addr, length=None):
-        length_int = 1 if length is None else length
-        datas = []
-        for i in range(length_int):
-            record = EtherboneRecord()
-            record.reads = EtherboneReads(addrs=[addr + 4*i])
-            record.rcount = 1
+    def send_record(self, record):
+        packet = EtherbonePacket()
+        packet.records = [record]
+        packet.encode()
+        self.transport.send(bytes(packet))
 
-            packet = EtherbonePacket()
-            packet.records = [record]
-            packet.encode()
-            self.socket.sendto(bytes(packet), ("127.0.0.1", 1234))
+    def recv_record(self):
+        data = self.transport.recv(4096)
+        packet = EtherbonePacket(data)
+        packet.decode()
+        return packet.records.pop()
 
-            data, addr = self.socket.recvfrom(1024)
-            packet = EtherbonePacket(data)
-            packet.decode()
-            datas.append(packet.records.pop().writes.get_datas()[0])
+    def read_list(self, addrs):
+        chunks = [addrs[i:i + etherbone_max_count] for i in range(0, len(addrs), etherbone_max_count)]
+        datas = [None]*len(chunks)
+        sent = 0
+        received = 0
+        while received < len(chunks):
+            # send reads, base_ret_addr is used to identify the replies.
+            while sent < len(chunks) and (sent - received) < self.max_inflight:
+                record = EtherboneRecord()
+                record.reads = EtherboneReads(base_ret_addr=sent, addrs=chunks[sent])
+                record.rcount = len(chunks[sent])
+                self.send_record(record)
+                sent += 1
+            # receive datas
+            record = self.recv_record()
+            index = record.writes.base_addr
+            if index < len(chunks) and datas[index] is None:
+                datas[index] = record.writes.get_datas()
+                received += 1
+        r = []
+        for data in datas:
+            r += data
+        return r
+
+    def read(self, addr, length=None):
+        length_int = 1 if length is None else length
+        datas = self.read_list([addr + 4*i for i in range(length_int)])
         if self.debug:
             for i, data in enumerate(datas):
                 print("read {:08x} @ {:08x}".format(data, addr + 4*i))
         return datas[0] if length is None else datas
 
-    def write(self, addr, datas):
-        datas = datas if isinstance(datas, list) else [datas]
-        for i, data in enumerate(datas):
+    def write_list(self, addrs, datas):
+        # coalesce contiguous writes in records (a record writes incrementing addresses).
+        i = 0
+        while i < len(addrs):
+            n = 1
+            while (i + n < len(addrs) and n < etherbone_max_count and
+                   addrs[i + n] == addrs[i] + 4*n):
+                n += 1
             record = EtherboneRecord()
-            record.writes = EtherboneWrites(base_addr=addr + 4*i, datas=[data])
-            record.wcount = 1
-
-            packet = EtherbonePacket()
-            packet.records = [record]
-            packet.encode()
-            self.socket.sendto(bytes(packet), ("127.0.0.1", 1234))
+            record.writes = EtherboneWrites(base_addr=addrs[i], datas=datas[i:i + n])
+            record.wcount = n
+            self.send_record(record)
+            i += n
 
-            if self.debug:
+    def write(self, addr, datas):
+        datas = datas if isinstance(datas, list) else [datas]
+        self.write_list([addr + 4*i for i in range(len(datas))], datas)
+        if self.debug:
+            for i, data in enumerate(datas):
                 print("write {:08x} @ {:08x}".format(data, addr + 4*i))
 
 
@@ -58,8 +93,8 @@ if __name__ == '__main__':
         print("%08x" %etherbone.read(0x10000000 + 4*i))
 
     identifier = ""
-    for i in range(0, 32):
-        identifier += "%c" %etherbone.read(0xe0001800 + 4*i)
+    for data in etherbone.read(0xe0001800, 32):
+        identifier += "%c" %data
     print("\nSoC identifier: " + identifier)
 
     pcie_id = etherbone.read(0xe000881c)
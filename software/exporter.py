@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from etherbone import Etherbone
+from transport import open_transport
+from telemetry import TelemetryPoller
+
+# PCIe PHY status CSRs exported as gauges.
+pcie_phy_gauges = [
+    "pcie_phy_lnk_up",
+    "pcie_phy_link_status",
+    "pcie_phy_msi_enable",
+    "pcie_phy_bus_master_enable",
+    "pcie_phy_max_request_size",
+    "pcie_phy_max_payload_size",
+]
+
+# Histogram ----------------------------------------------------------------------------------------
+
+class Histogram:
+    # Prometheus-style cumulative histogram (buckets are upper bounds, +Inf is implicit).
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0]*(len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        r = []
+        count = 0
+        for c in self.counts:
+            count += c
+            r.append(count)
+        return r
+
+
+def exponential_buckets(start, factor, count):
+    return [start*factor**i for i in range(count)]
+
+# Exporter -----------------------------------------------------------------------------------------
+
+class Exporter:
+    # Keeps totals of the telemetry counters (extended over the gateware counter widths), their
+    # rates over the last sample period and histograms of the rates of the byte counters and of
+    # the high-water marks.
+    def __init__(self, poller, namespace="screamer"):
+        self.poller = poller
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.rates = {}
+        self.gauges = {}
+        self.histograms = {}
+        for name in poller.names:
+            if poller.is_gauge(name):
+                if name.endswith("_level"):
+                    self.histograms[name] = Histogram(exponential_buckets(1, 2, 16))
+            else:
+                self.totals[name] = 0
+                if name.endswith("_bytes"):
+                    self.histograms[name + "_per_second"] = Histogram(exponential_buckets(1e3, 4, 12))
+        self.time, self.values = poller.sample()
+
+    def update(self):
+        now, values = self.poller.sample()
+        deltas = self.poller.deltas(self.values, values)
+        period = now - self.time
+        with self.lock:
+            for name, delta in deltas.items():
+                if name in self.totals:
+                    self.totals[name] += delta
+                    self.rates[name] = delta/period if period > 0 else 0
+                else:
+                    self.gauges[name] = delta
+                if name in self.histograms:
+                    self.histograms[name].observe(delta)
+                elif name + "_per_second" in self.histograms:
+                    self.histograms[name + "_per_second"].observe(self.rates[name])
+        self.time, self.values = now, values
+
+    def json(self):
+        with self.lock:
+            return json.dumps({
+                "time":   self.time,
+                "totals": self.totals,
+                "rates":  self.rates,
+                "gauges": self.gauges,
+            })
+
+    def prometheus(self):
+        lines = []
+        def metric(name, kind, samples):
+            name = self.namespace + "_" + name
+            lines.append("# TYPE {} {}".format(name, kind))
+            for suffix, labels, value in samples:
+                lines.append("{}{}{} {}".format(name, suffix, labels, value))
+        with self.lock:
+            for name, total in self.totals.items():
+                metric(name + "_total", "counter", [("", "", total)])
+                metric(name + "_per_second", "gauge", [("", "", self.rates.get(name, 0))])
+            for name, value in self.gauges.items():
+                metric(name, "gauge", [("", "", value)])
+            for name, histogram in self.histograms.items():
+                bounds = [str(bucket) for bucket in histogram.buckets] + ["+Inf"]
+                samples = [("_bucket", "{{le=\"{}\"}}".format(bound), count)
+                    for bound, count in zip(bounds, histogram.cumulative_counts())]
+                samples += [("_sum", "", histogram.sum), ("_count", "", histogram.count)]
+                metric(name + "_histogram", "histogram", samples)
+        return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(exporter, address, port):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = exporter.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer((address, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="PCIe Screamer telemetry exporter")
+    parser.add_argument("--csr-csv",   default="../test/csr.csv", help="CSR definitions")
+    parser.add_argument("--transport", default="udp",             help="udp[:ip] (usb2udp), ft60x[:device] or sim")
+    parser.add_argument("--rate",      default=10.0, type=float,  help="samples per second")
+    parser.add_argument("--prometheus-port",    default=None, type=int, help="serve Prometheus metrics on /metrics at this port")
+    parser.add_argument("--prometheus-address", default="127.0.0.1",    help="Prometheus server address")
+    parser.add_argument("--json",      default=None, help="append JSON lines to this file (- for stdout)")
+    parser.add_argument("--json-every", default=1, type=int, help="samples between JSON lines")
+    args = parser.parse_args()
+
+    etherbone = Etherbone(args.csr_csv, transport=open_transport(args.transport, "wishbone"))
+    exporter = Exporter(TelemetryPoller(etherbone, gauges=pcie_phy_gauges))
+    if args.prometheus_port is not None:
+        serve_prometheus(exporter, args.prometheus_address, args.prometheus_port)
+    output = None
+    if args.json is not None:
+        output = sys.stdout if args.json == "-" else open(args.json, "a")
+
+    period = 1/args.rate
+    deadline = time.time()
+    n = 0
+    while True:
+        # do not try to catch up when late (slow link), keep the sampling period.
+        deadline = max(deadline + period, time.time())
+        time.sleep(max(0, deadline - time.time()))
+        exporter.update()
+        n += 1
+        if output is not None and n%args.json_every == 0:
+            output.write(exporter.json() + "\n")
+            output.flush()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import os
+import struct
+from collections import deque
+
+# USB ports of the gateware crossbar (PCIeScreamer.usb_map).
+ft60x_ports = {
+    "wishbone": 0,
+    "tlp":      1
+}
+
+# USBPacketizer/USBDepacketizer framing: preamble, dst, length (little-endian dwords).
+ft60x_preamble = 0x5aa55aa5
+ft60x_header   = struct.Struct("<III")
+ft60x_preamble_bytes = ft60x_preamble.to_bytes(4, byteorder="little")
+
+
+class FT60xPort:
+    # Transport over one port of a FT60xStream (see transport.py).
+    def __init__(self, stream, port):
+        self.stream = stream
+        self.port = port
+
+    def send(self, data):
+        self.stream.send(self.port, data)
+        return len(data)
+
+    def recv(self, bufsize):
+        return self.stream.recv(self.port)[:bufsize]
+
+    def recv_into(self, buffer, nbytes=0):
+        nbytes = len(buffer) if nbytes == 0 else nbytes
+        data = self.stream.recv(self.port)
+        n = min(len(data), nbytes)
+        buffer[:n] = data[:n]
+        if n < len(data):
+            # keep the remaining data for the next call.
+            self.stream.queues[self.port].appendleft(data[n:])
+        return n
+
+    def close(self):
+        pass
+
+
+class FT60xStream:
+    # Direct access to the FT601 through the ft60x driver (/dev/ft60x*): frames are written
+    # with their USB header, the device is read in large chunks into a preallocated buffer and
+    # frames are demultiplexed per port (resynchronizing on the preamble if needed).
+    def __init__(self, device="/dev/ft60x0", buffer_size=2**22, read_size=2**20):
+        assert buffer_size >= 2*read_size
+        self.fd = os.open(device, os.O_RDWR)
+        self.read_size = read_size
+        self.buf = bytearray(buffer_size)
+        self.view = memoryview(self.buf)
+        self.rd_ptr = 0
+        self.wr_ptr = 0
+        self.queues = {}
+        self.resyncs = 0
+
+    def close(self):
+        os.close(self.fd)
+
+    def get_port(self, port):
+        self.queues.setdefault(port, deque())
+        return FT60xPort(self, port)
+
+    def send(self, port, data):
+        frame = ft60x_header.pack(ft60x_preamble, port, len(data)) + bytes(data)
+        view = memoryview(frame)
+        while len(view):
+            n = os.write(self.fd, view)
+            view = view[n:]
+
+    def fill(self):
+        if len(self.buf) - self.wr_ptr < self.read_size:
+            length = self.wr_ptr - self.rd_ptr
+            self.view[:length] = self.view[self.rd_ptr:self.wr_ptr]
+            self.rd_ptr = 0
+            self.wr_ptr = length
+        n = os.readv(self.fd, [self.view[self.wr_ptr:self.wr_ptr + self.read_size]])
+        self.wr_ptr += n
+        return n
+
+    def extract(self):
+        while self.wr_ptr - self.rd_ptr >= ft60x_header.size:
+            # resynchronize on preamble
+            if self.view[self.rd_ptr:self.rd_ptr + 4] != ft60x_preamble_bytes:
+                position = self.buf.find(ft60x_preamble_bytes, self.rd_ptr, self.wr_ptr)
+                self.resyncs += 1
+                if position < 0:
+                    # keep the last bytes, they may be the start of a preamble.
+                    self.rd_ptr = self.wr_ptr - 3
+                    return
+                self.rd_ptr = position
+                continue
+            preamble, port, length = ft60x_header.unpack_from(self.buf, self.rd_ptr)
+            start = self.rd_ptr + ft60x_header.size
+            if self.wr_ptr - start < length:
+                return
+            if port in self.queues:
+                self.queues[port].append(bytes(self.view[start:start + length]))
+            self.rd_ptr = start + length
+
+    def recv(self, port):
+        queue = self.queues[port]
+        while not len(queue):
+            self.fill()
+            self.extract()
+        return queue.popleft()
@@ -1,56 +1,63 @@
-import socket
+import asyncio
+import argparse
 
 from tlp import *
+from client import TLPClient
+from transport import open_transport
 
 
 class Injector:
-    def __init__(self, ip="127.0.0.1", port=2345):
-        self.ip = ip
-        self.port = port
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.sendto(bytes([0]), (self.ip, self.port))
+    # Answers the RD32s received from the target with CPLDs, prints the received TLPs (run()
+    # blocks, serve() runs on an existing event loop).
+    def __init__(self, ip="127.0.0.1", port=2345, transport=None, with_tlp_aggregation=False,
+        with_tlp_timestamp=False, with_tlp_length=False):
+        self.client = TLPClient(ip, port,
+            transport            = transport,
+            with_tlp_aggregation = with_tlp_aggregation,
+            with_tlp_timestamp   = with_tlp_timestamp,
+            with_tlp_length      = with_tlp_length)
 
     def run(self):
-        dwords = []
-        while True:
-            # receive dwords
-            data, addr = self.socket.recvfrom(1024)
-            for i in range(len(data)//4):
-                dword = int.from_bytes(data[4*i:4*(i+1)], byteorder="little")
-                dwords.append(dword)
-            # extract tlps
-            while len(dwords):
-                tlp, length = parse_dwords(dwords)
-                if tlp is None:
-                    break
-                else:
-                    print(tlp)
-                    if isinstance(tlp, RD32):
-                        cpl = CPLD()
-                        cpl.fmt = 0x2
-                        cpl.type = 0xa
-                        cpl.length = 1
-                        cpl.lower_address = (tlp.address & 0xff)*4
-                        cpl.requester_id = 0x0
-                        cpl.completer_id = 0x100
-                        cpl.byte_count = 4
-                        cpl.tag = 0x0
-                        if tlp.address == 0x3c140601:
-                            cpl.encode_dwords([0x50000000]) # FIXME (P)
-                        elif tlp.address == 0x3c140602:
-                            cpl.encode_dwords([0x51000000]) # FIXME (Q)
-                        elif tlp.address == 0x3c140603:
-                            cpl.encode_dwords([0x52000000]) # FIXME (R)
-                        else:
-                            cpl.encode_dwords([0x00000000]) # FIXME
-                        packet = bytes()
-                        for dword in cpl.dwords:
-                            packet += dword.to_bytes(4, byteorder="little")
-                        self.socket.sendto(packet, (self.ip, self.port))
-
-                    dwords = dwords[length:]
+        asyncio.run(self.serve())
 
+    async def serve(self):
+        async with self.client:
+            async for tlp in self.client.tlps():
+                print(tlp)
+                if isinstance(tlp, RD32):
+                    cpl = CPLD()
+                    cpl.fmt = 0x2
+                    cpl.type = 0xa
+                    cpl.length = 1
+                    cpl.lower_address = (tlp.address & 0xff)*4
+                    cpl.requester_id = 0x0
+                    cpl.completer_id = 0x100
+                    cpl.byte_count = 4
+                    cpl.tag = 0x0
+                    if tlp.address == 0x3c140601:
+                        cpl.encode_dwords([0x50000000]) # FIXME (P)
+                    elif tlp.address == 0x3c140602:
+                        cpl.encode_dwords([0x51000000]) # FIXME (Q)
+                    elif tlp.address == 0x3c140603:
+                        cpl.encode_dwords([0x52000000]) # FIXME (R)
+                    else:
+                        cpl.encode_dwords([0x00000000]) # FIXME
+                    self.client.send(cpl.dwords)
 
-if __name__ == '__main__':
-    injector = Injector()
+
+def main():
+    parser = argparse.ArgumentParser(description="PCIe Screamer TLP injector")
+    parser.add_argument("--transport", default="udp", help="udp[:ip] (usb2udp), ft60x[:device] or sim")
+    parser.add_argument("--with-tlp-aggregation", action="store_true", help="gateware built with --with-tlp-aggregation")
+    parser.add_argument("--with-tlp-timestamp",   action="store_true", help="gateware built with --with-tlp-timestamp")
+    parser.add_argument("--with-tlp-length",      action="store_true", help="gateware built with --with-tlp-length")
+    args = parser.parse_args()
+
+    injector = Injector(transport=open_transport(args.transport, "tlp"),
+        with_tlp_aggregation=args.with_tlp_aggregation,
+        with_tlp_timestamp=args.with_tlp_timestamp,
+        with_tlp_length=args.with_tlp_length)
     injector.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import sys
+from functools import partial
+
+from tlp import *
+
+
+class RingBuffer:
+    # Preallocated receive buffer: datagrams are received in place with recv_into and viewed as
+    # little-endian dwords (memoryview.cast, host must be little-endian), TLPs are then parsed
+    # at their offset in the buffer. The unconsumed tail (a partial TLP) is moved back to the
+    # start of the buffer when less than max_datagram_size bytes remain free. Errors never raise
+    # (the buffer is filled from the receive path): a tail that leaves no room for a datagram
+    # can't be a partial TLP and is dropped (dropped: bytes), dwords that can't be decoded are
+    # skipped until a TLP decodes (resyncs: dwords).
+    def __init__(self, size=2**20, max_datagram_size=2**16, timestamp=False, length=False):
+        assert sys.byteorder == "little"
+        assert size%4 == 0 and size >= 2*max_datagram_size
+        self.max_datagram_size = max_datagram_size
+        if length:
+            self.parse = partial(parse_length_prefixed_dwords, timestamp=timestamp)
+        else:
+            self.parse = parse_timestamped_dwords if timestamp else parse_dwords
+        self.buf    = bytearray(size)
+        self.bytes  = memoryview(self.buf)
+        self.dwords = self.bytes.cast("I")
+        self.rd_ptr = 0 # in dwords
+        self.wr_ptr = 0 # in bytes
+        self.dropped = 0
+        self.resyncs = 0
+
+    @property
+    def level(self):
+        return self.wr_ptr//4 - self.rd_ptr
+
+    def compact(self):
+        start  = 4*self.rd_ptr
+        length = self.wr_ptr - start
+        self.bytes[:length] = self.bytes[start:self.wr_ptr]
+        self.rd_ptr = 0
+        self.wr_ptr = length
+
+    def make_room(self, n):
+        if len(self.buf) - self.wr_ptr < n:
+            self.compact()
+        if len(self.buf) - self.wr_ptr < n:
+            self.dropped += self.wr_ptr
+            self.rd_ptr = 0
+            self.wr_ptr = 0
+
+    def reserve(self):
+        # free space for a datagram received in place (to be committed).
+        self.make_room(self.max_datagram_size)
+        return self.bytes[self.wr_ptr:]
+
+    def commit(self, n, aggregated=False):
+        # aggregated: USBAggregator packet (--with-tlp-aggregation), the sub-headers (length in
+        # bytes) are removed in place.
+        if aggregated:
+            start  = self.wr_ptr
+            end    = self.wr_ptr + n
+            offset = self.wr_ptr
+            while offset + 4 <= end:
+                length = int.from_bytes(self.bytes[offset:offset + 4], byteorder="little")
+                length = min(length, end - offset - 4)
+                self.bytes[start:start + length] = self.bytes[offset + 4:offset + 4 + length]
+                start  += length
+                offset += 4 + length
+            n = start - self.wr_ptr
+        self.wr_ptr += n
+        return n
+
+    def recv_into(self, sock, aggregated=False):
+        return self.commit(sock.recv_into(self.reserve()), aggregated)
+
+    def write(self, data):
+        if len(data) > len(self.buf):
+            self.dropped += len(data)
+            return 0
+        self.make_room(len(data))
+        self.bytes[self.wr_ptr:self.wr_ptr + len(data)] = data
+        self.wr_ptr += len(data)
+        return len(data)
+
+    def tlps(self):
+        end = self.wr_ptr//4
+        while self.rd_ptr < end:
+            try:
+                tlp, length = self.parse(self.dwords, self.rd_ptr, end)
+            except KeyError: # unknown fmt/type
+                self.resyncs += 1
+                self.rd_ptr += 1
+                continue
+            if length == 0:
+                break
+            self.rd_ptr += length
+            if tlp is not None:
+                yield tlp
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import argparse
+
+from etherbone import Etherbone
+from transport import open_transport
+
+
+class TelemetryPoller:
+    # Samples the counters of the telemetry gateware (--with-telemetry): a latch write copies all
+    # the counters to their CSRs on the same cycle, then all the CSRs are read in a single batch.
+    # gauges are other status CSRs (full names) read in the same batch.
+    def __init__(self, etherbone, prefix="telemetry_", gauges=[]):
+        self.etherbone = etherbone
+        self.latch = etherbone.regs.d.get(prefix + "latch", None)
+        self.regs = [reg for name, reg in etherbone.regs.d.items()
+            if name.startswith(prefix) and reg.mode == "ro"]
+        self.names = [reg.name[len(prefix):] for reg in self.regs]
+        self.gauges = [name for name in gauges if name in etherbone.regs.d]
+        self.regs += [etherbone.regs.d[name] for name in self.gauges]
+        self.names += self.gauges
+        self.widths = [reg.length*reg.data_width for reg in self.regs]
+        self.addrs = []
+        for reg in self.regs:
+            self.addrs += [reg.addr + 4*i for i in range(reg.length)]
+
+    def sample(self):
+        if self.latch is not None:
+            self.latch.write(1)
+        datas = iter(self.etherbone.read_list(self.addrs))
+        values = {}
+        for name, reg in zip(self.names, self.regs):
+            value = 0
+            for i in range(reg.length):
+                value = (value << reg.data_width) | next(datas)
+            values[name] = value
+        return time.time(), values
+
+    def deltas(self, previous, current):
+        # counters differences (modulo the counter widths), high-water marks and gauges are
+        # returned as is.
+        r = {}
+        for name, width in zip(self.names, self.widths):
+            if self.is_gauge(name):
+                r[name] = current[name]
+            else:
+                r[name] = (current[name] - previous[name]) % 2**width
+        return r
+
+    def is_gauge(self, name):
+        return name.endswith("_level") or name in self.gauges
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PCIe Screamer telemetry poller")
+    parser.add_argument("--csr-csv",   default="../test/csr.csv", help="CSR definitions")
+    parser.add_argument("--transport", default="udp",             help="udp[:ip] (usb2udp), ft60x[:device] or sim")
+    parser.add_argument("--rate",      default=1.0, type=float,   help="samples per second")
+    parser.add_argument("--count",     default=0,   type=int,     help="number of samples (0: infinite)")
+    args = parser.parse_args()
+
+    etherbone = Etherbone(args.csr_csv, transport=open_transport(args.transport, "wishbone"))
+    poller = TelemetryPoller(etherbone)
+
+    period = 1/args.rate
+    deadline, values = poller.sample()
+    n = 0
+    while args.count == 0 or n < args.count:
+        deadline += period
+        time.sleep(max(0, deadline - time.time()))
+        now, current = poller.sample()
+        deltas = poller.deltas(values, current)
+        print("{:.3f} ".format(now) + " ".join("{}={}".format(k, v) for k, v in deltas.items()))
+        sys.stdout.flush()
+        values = current
+        n += 1
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,39 @@ def get_field_data(field, dwords):
     return (dwords[field.byte//4] >> field.offset) & (2**field.width-1)
 
 
+# Header fields are resolved once to shift/mask tables and compiled to specialized
+# functions packing/unpacking the whole header in one pass.
+class TLPHeaderCodec:
+    def __init__(self, header, ndwords=3):
+        self.ndwords = ndwords
+        self.fields = []
+        for name, field in header.fields.items():
+            self.fields.append((name, field.byte//4, field.offset, 2**field.width-1))
+        self.decode = self._compile_decode()
+        self.encode = self._compile_encode()
+
+    def _compile(self, src, name):
+        namespace = {}
+        exec(src, namespace)
+        return namespace[name]
+
+    def _compile_decode(self):
+        # def decode(o, d): o.name = (d[n] >> offset) & mask; ...
+        src = "def decode(o, d):\n"
+        for name, n, offset, mask in self.fields:
+            src += "    o.{} = (d[{}] >> {}) & 0x{:x}\n".format(name, n, offset, mask)
+        return self._compile(src, "decode")
+
+    def _compile_encode(self):
+        # def encode(o): return [((o.name & mask) << offset) | ..., ...]
+        dwords = [[] for n in range(self.ndwords)]
+        for name, n, offset, mask in self.fields:
+            dwords[n].append("((o.{} & 0x{:x}) << {})".format(name, mask, offset))
+        src = "def encode(o):\n"
+        src += "    return [" + ", ".join(" | ".join(d) if d else "0" for d in dwords) + "]\n"
+        return self._compile(src, "encode")
+
+
 tlp_headers_dict = {
     "RD32": tlp_request_header,
     "WR32": tlp_request_header,
@@ -13,24 +46,25 @@ tlp_headers_dict = {
     "CPL":  tlp_completion_header
 }
 
+tlp_codecs_dict = {k: TLPHeaderCodec(v) for k, v in tlp_headers_dict.items()}
+
 
 class TLP:
     def __init__(self, name, dwords=[0, 0, 0]):
         self.name = name
+        if isinstance(dwords, memoryview):
+            dwords = dwords.tolist()
         self.header = dwords[:3]
         self.data = dwords[3:]
         self.dwords = self.header + self.data
+        self.timestamp = None
         self.decode_dwords()
 
     def decode_dwords(self):
-        for k, v in tlp_headers_dict[self.name].fields.items():
-            setattr(self, k, get_field_data(v, self.header))
+        tlp_codecs_dict[self.name].decode(self, self.header)
 
     def encode_dwords(self, data=[]):
-        self.header = [0, 0, 0]
-        for k, v in tlp_headers_dict[self.name].fields.items():
-            field = tlp_headers_dict[self.name].fields[k]
-            self.header[field.byte//4] |= (getattr(self, k) << field.offset)
+        self.header = tlp_codecs_dict[self.name].encode(self)
         self.data = data
         self.dwords = self.header + self.data
         return self.dwords
@@ -38,6 +72,8 @@ class TLP:
     def __repr__(self):
         r = self.name + "\n"
         r += "--------\n"
+        if self.timestamp is not None:
+            r += "timestamp : {}".format(self.timestamp) + "\n"
         for k in sorted(tlp_headers_dict[self.name].fields.keys()):
             r += k + " : 0x{:x}".format(getattr(self, k)) + "\n"
         if len(self.data) != 0:
@@ -72,20 +108,132 @@ class Unknown:
         r = "UNKNOWN\n"
         return r
 
+# fmt/type: (class, header length in dwords)
 fmt_type_dict = {
     fmt_type_dict["mem_rd32"]: (RD32, 3),
-    fmt_type_dict["mem_wr32"]: (WR32, 4),
-    fmt_type_dict["cpld"]: (CPLD, 4),
+    fmt_type_dict["mem_wr32"]: (WR32, 3),
+    fmt_type_dict["cpld"]: (CPLD, 3),
     fmt_type_dict["cpl"]: (CPL, 3)
 }
 
 
-def parse_dwords(dwords):
-    f = get_field_data(tlp_common_header.fields["fmt"], dwords)
-    t = get_field_data(tlp_common_header.fields["type"], dwords)
-    fmt_type = (f << 5) | t
+fmt_field    = tlp_common_header.fields["fmt"]
+type_field   = tlp_common_header.fields["type"]
+length_field = tlp_request_header.fields["length"]
+fmt_shift, fmt_mask       = fmt_field.offset, 2**fmt_field.width-1
+type_shift, type_mask     = type_field.offset, 2**type_field.width-1
+length_shift, length_mask = length_field.offset, 2**length_field.width-1
+
+
+def get_fmt_type(dwords, offset=0):
+    dword = dwords[offset]
+    return (((dword >> fmt_shift) & fmt_mask) << 5) | ((dword >> type_shift) & type_mask)
+
+
+def get_data_length(dwords, offset=0):
+    # payload length in dwords (fmt[1]: with data, length 0 is 1024 dwords)
+    dword = dwords[offset]
+    if (dword >> fmt_shift) & 0b10:
+        return ((dword >> length_shift) & length_mask) or (length_mask + 1)
+    return 0
+
+
+def parse_dwords(dwords, offset=0, end=None):
+    end = len(dwords) if end is None else end
+    fmt_type = get_fmt_type(dwords, offset)
     tlp_cls, tlp_length = fmt_type_dict[fmt_type]
-    if len(dwords) >= tlp_length:
-        return tlp_cls(dwords[:tlp_length]), tlp_length
+    tlp_length += get_data_length(dwords, offset)
+    if end - offset >= tlp_length:
+        return tlp_cls(dwords[offset:offset + tlp_length]), tlp_length
     else:
         return None, 0
+
+
+# TLPs from a gateware built with --with-tlp-timestamp are preceded by a 64-bit timestamp
+# (low dword first).
+timestamp_length = 2
+
+def parse_timestamped_dwords(dwords, offset=0, end=None):
+    end = len(dwords) if end is None else end
+    if end - offset < timestamp_length + 1:
+        return None, 0
+    tlp, length = parse_dwords(dwords, offset + timestamp_length, end)
+    if tlp is None:
+        return None, 0
+    tlp.timestamp = dwords[offset] | (dwords[offset + 1] << 32)
+    return tlp, timestamp_length + length
+
+
+# TLPs from a gateware built with --with-tlp-length are preceded by a dword giving their length in
+# dwords (timestamp included): the TLPs are framed by this length, a TLP that can't be decoded is
+# skipped (returned as None with its length).
+length_prefix_length = 1
+length_prefix_mask   = 0xffff
+
+def parse_length_prefixed_dwords(dwords, offset=0, end=None, timestamp=False):
+    end = len(dwords) if end is None else end
+    if end - offset < length_prefix_length:
+        return None, 0
+    length = dwords[offset] & length_prefix_mask
+    if end - offset < length_prefix_length + length:
+        return None, 0
+    parse = parse_timestamped_dwords if timestamp else parse_dwords
+    try:
+        tlp, tlp_length = parse(dwords, offset + length_prefix_length, offset + length_prefix_length + length)
+    except KeyError: # unknown fmt/type
+        tlp = None
+    return tlp, length_prefix_length + length
+
+
+def split_read(address, length, max_request_size=128):
+    # Split a read of length dwords in requests of at most max_request_size bytes that do not
+    # cross 4KB boundaries.
+    while length:
+        n = min(length, min(max_request_size, 4096 - address%4096)//4)
+        yield address, n
+        address += 4*n
+        length  -= n
+
+
+class ReadRequest:
+    def __init__(self, address, length, tag, requester_id=0x100):
+        self.address = address
+        self.length = length
+        self.tag = tag
+        self.requester_id = requester_id
+        self.datas = [None]*length
+        self.done = False
+
+    def encode_dwords(self):
+        rd = RD32()
+        rd.fmt = 0b00
+        rd.type = 0b00000
+        rd.length = self.length
+        rd.first_be = 0xf
+        rd.last_be = 0xf if self.length > 1 else 0x0
+        rd.address = self.address//4
+        rd.requester_id = self.requester_id
+        rd.tag = self.tag
+        return rd.encode_dwords()
+
+    def complete(self, tlp):
+        # A read can be completed by several CPLDs: byte_count gives the remaining bytes of the
+        # request (including the completion) and lower_address the address of the first byte.
+        # Returns False if the completion does not match the request.
+        if tlp.tag != self.tag:
+            return False
+        # unsuccessful completion (no data): read all ones like a root complex.
+        if isinstance(tlp, CPL):
+            self.datas = [0xffffffff if data is None else data for data in self.datas]
+            self.done = True
+            return True
+        byte_count = tlp.byte_count or 4096
+        offset = 4*self.length - byte_count
+        if offset < 0 or offset//4 + len(tlp.data) > self.length:
+            return False
+        if (self.address + offset) & 0x7f != tlp.lower_address:
+            return False
+        self.datas[offset//4:offset//4 + len(tlp.data)] = tlp.data
+        if byte_count <= 4*len(tlp.data):
+            self.done = True
+        return True
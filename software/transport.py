@@ -0,0 +1,196 @@
+import sys
+import socket
+import struct
+from collections import deque
+
+from litex.soc.tools.remote.etherbone import *
+
+from tlp import *
+from ft60x import FT60xStream, ft60x_ports
+
+# usb2udp ports of the gateware crossbar ports.
+udp_ports = {
+    "wishbone": 1234,
+    "tlp":      2345
+}
+
+
+# Transports exchange datagrams with one port of the board: each send() is one USB packet,
+# recv()/recv_into() return one USB packet.
+
+class UDPTransport:
+    # Through usb2udp.
+    def __init__(self, ip="127.0.0.1", port=2345):
+        self.ip = ip
+        self.port = port
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, data):
+        return self.socket.sendto(data, (self.ip, self.port))
+
+    def recv(self, bufsize):
+        data, addr = self.socket.recvfrom(bufsize)
+        return data
+
+    def recv_into(self, buffer, nbytes=0):
+        return self.socket.recv_into(buffer, nbytes)
+
+    def close(self):
+        self.socket.close()
+
+
+class SimTransport:
+    # In-process transport to a SimTarget: replies are generated synchronously by send().
+    def __init__(self, target, port):
+        self.target = target
+        self.port = port
+        self.queue = target.queues.setdefault(port, deque())
+
+    def send(self, data):
+        self.target.handle(self.port, bytes(data))
+        return len(data)
+
+    def recv(self, bufsize):
+        if not len(self.queue):
+            raise TimeoutError("no reply from simulated target")
+        return self.queue.popleft()[:bufsize]
+
+    def recv_into(self, buffer, nbytes=0):
+        data = self.recv(len(buffer) if nbytes == 0 else nbytes)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        pass
+
+
+class SimLoopback(SimTransport):
+    # Simulated --with-loopback gateware: packets are sent back unchanged.
+    def __init__(self):
+        self.queue = deque()
+
+    def send(self, data):
+        self.queue.append(bytes(data))
+        return len(data)
+
+
+class SimTarget:
+    # Simulated board: RD32/WR32 TLPs access a backing memory image (like the host memory
+    # behind the PCIe link) and are answered with CPLDs split on the read completion boundary
+    # and max_payload_size; reads outside the image get an Unsupported Request CPL. Etherbone
+    # records access a sparse wishbone address space (regs).
+    def __init__(self, memory=None, base=0, max_payload_size=128, rcb=64, completer_id=0x0):
+        assert sys.byteorder == "little"
+        self.memory = bytearray(2**20) if memory is None else bytearray(memory)
+        self.dwords = memoryview(self.memory).cast("I")
+        self.base = base
+        self.max_payload_size = max_payload_size
+        self.rcb = rcb
+        self.completer_id = completer_id
+        self.regs = {}
+        self.queues = {}
+
+    def get_port(self, port):
+        return SimTransport(self, port)
+
+    def handle(self, port, data):
+        if port == ft60x_ports["tlp"]:
+            self.handle_tlps(data)
+        elif port == ft60x_ports["wishbone"]:
+            self.handle_etherbone(data)
+
+    def reply(self, port, data):
+        self.queues.setdefault(port, deque()).append(data)
+
+    def send_tlp(self, dwords):
+        self.reply(ft60x_ports["tlp"], struct.pack("<{}I".format(len(dwords)), *dwords))
+
+    def handle_tlps(self, data):
+        dwords = memoryview(data[:len(data) & ~3]).cast("I")
+        offset = 0
+        while offset < len(dwords):
+            tlp, length = parse_dwords(dwords, offset)
+            if tlp is None:
+                break
+            offset += length
+            if isinstance(tlp, RD32):
+                self.complete(tlp)
+            elif isinstance(tlp, WR32):
+                index = (4*tlp.address - self.base)//4
+                if 0 <= index and index + len(tlp.data) <= len(self.dwords):
+                    struct.pack_into("<{}I".format(len(tlp.data)), self.memory, 4*index, *tlp.data)
+
+    def complete(self, rd):
+        address = 4*rd.address
+        length = rd.length or 1024
+        index = (address - self.base)//4
+        if index < 0 or index + length > len(self.dwords):
+            cpl = CPL()
+            cpl.fmt = 0b00
+            cpl.type = 0b01010
+            cpl.status = 0b001 # Unsupported Request
+            cpl.byte_count = 4*length
+            cpl.lower_address = address & 0x7f
+            cpl.requester_id = rd.requester_id
+            cpl.completer_id = self.completer_id
+            cpl.tag = rd.tag
+            self.send_tlp(cpl.encode_dwords())
+            return
+        byte_count = 4*length
+        while byte_count:
+            # first completion ends on a rcb boundary, next ones are multiples of rcb.
+            n = min(byte_count, self.max_payload_size - address%self.rcb)
+            cpl = CPLD()
+            cpl.fmt = 0b10
+            cpl.type = 0b01010
+            cpl.length = n//4
+            cpl.byte_count = byte_count & 0xfff
+            cpl.lower_address = address & 0x7f
+            cpl.requester_id = rd.requester_id
+            cpl.completer_id = self.completer_id
+            cpl.tag = rd.tag
+            self.send_tlp(cpl.encode_dwords(self.dwords[index:index + n//4].tolist()))
+            address    += n
+            index      += n//4
+            byte_count -= n
+
+    def handle_etherbone(self, data):
+        packet = EtherbonePacket(data)
+        packet.decode()
+        for record in packet.records:
+            if record.wcount:
+                for i, data in enumerate(record.writes.get_datas()):
+                    self.regs[record.writes.base_addr + 4*i] = data
+            if record.rcount:
+                reply = EtherboneRecord()
+                reply.writes = EtherboneWrites(base_addr=record.reads.base_ret_addr,
+                    datas=[self.regs.get(addr, 0) for addr in record.reads.get_addrs()])
+                reply.wcount = record.rcount
+                packet = EtherbonePacket()
+                packet.records = [reply]
+                packet.encode()
+                self.reply(ft60x_ports["wishbone"], bytes(packet))
+
+
+ft60x_streams = {}
+sim_target = None
+
+def open_transport(name, port):
+    # name: "udp[:ip]", "ft60x[:device]", "sim" or "sim-loopback"; port: "wishbone" or "tlp".
+    global sim_target
+    kind, _, arg = name.partition(":")
+    if kind == "udp":
+        return UDPTransport(arg or "127.0.0.1", udp_ports[port])
+    elif kind == "ft60x":
+        device = arg or "/dev/ft60x0"
+        if device not in ft60x_streams:
+            ft60x_streams[device] = FT60xStream(device)
+        return ft60x_streams[device].get_port(ft60x_ports[port])
+    elif kind == "sim":
+        if sim_target is None:
+            sim_target = SimTarget()
+        return sim_target.get_port(ft60x_ports[port])
+    elif kind == "sim-loopback":
+        return SimLoopback()
+    else:
+        raise ValueError("Unknown transport {}".format(name))
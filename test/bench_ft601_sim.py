@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import random
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from migen import *
+
+from gateware.ft601 import FT601Sync
+
+from ft601_model import ft601_pads, ft601_special_overrides, FT601Model
+from ft601_model import Throttle, send_words, receive_words
+
+# DUT ----------------------------------------------------------------------------------------------
+
+class FT601DUT(Module):
+    def __init__(self, **kwargs):
+        self.clock_domains.cd_usb = ClockDomain()
+        self.pads = ft601_pads()
+        self.submodules.phy = FT601Sync(self.pads, **kwargs)
+        self.submodules.model = FT601Model(self.pads, self.phy)
+
+# Generators ---------------------------------------------------------------------------------------
+
+def run_cycles(phy, cycles, stats, csrs):
+    for name, value in csrs.items():
+        yield getattr(phy, name).storage.eq(value)
+    for i in range(cycles):
+        yield
+    stats["cycles"] = cycles
+    stats["turnarounds"] = (yield phy.turnarounds.status)
+    stats["turnaround_cycles"] = (yield phy.turnaround_cycles.status)
+
+# Run ----------------------------------------------------------------------------------------------
+
+workloads = {
+    # name:      (uplink rate (FPGA --> host), downlink rate (host --> FPGA))
+    "capture":   (1.0, 0.0),
+    "sniffing":  (1.0, 0.1),
+    "injection": (0.1, 1.0),
+    "bidir":     (1.0, 1.0),
+}
+
+def run(workload, cycles, seed, host_rate=1.0, host_stalls=(0.0, 0), csrs={}, **kwargs):
+    rng = random.Random(seed)
+    uplink_rate, downlink_rate = workloads[workload]
+    dut = FT601DUT(**kwargs)
+    stats = {"cycles": 0, "turnarounds": 0, "turnaround_cycles": 0}
+    for name in ["uplink", "downlink"]:
+        for k in ["sent", "received", "errors"]:
+            stats[name + "_" + k] = 0
+    generators = {
+        "sys": [
+            run_cycles(dut.phy, cycles, stats, csrs),
+            send_words(dut.phy.sink, Throttle(rng, uplink_rate), stats, "uplink"),
+            receive_words(dut.phy.source, Throttle(rng), stats, "downlink"),
+        ],
+        "usb": [
+            send_words(dut.model.host_sink, Throttle(rng, downlink_rate, *host_stalls), stats, "downlink"),
+            receive_words(dut.model.host_source, Throttle(rng, host_rate, *host_stalls), stats, "uplink"),
+        ]
+    }
+    run_simulation(dut, generators, clocks={"sys": 10, "usb": 10},
+        special_overrides=ft601_special_overrides)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FT601Sync simulation benchmark (sustained throughput)")
+    parser.add_argument("--workload",          default="all", choices=list(workloads.keys()) + ["all"])
+    parser.add_argument("--cycles",            default=10000, type=int)
+    parser.add_argument("--host-rate",         default=1.0,  type=float, help="probability the host reads a word per cycle")
+    parser.add_argument("--host-stall-probability", default=0.0, type=float, help="probability the host starts a stall per cycle")
+    parser.add_argument("--host-stall-length", default=0,   type=int,   help="maximum host stall length (cycles)")
+    parser.add_argument("--timeout",           default=1024, type=int)
+    parser.add_argument("--read-fifo-depth",   default=128,  type=int)
+    parser.add_argument("--write-fifo-depth",  default=128,  type=int)
+    parser.add_argument("--read-buffer-depth", default=4,    type=int)
+    parser.add_argument("--deep-fifo-depth",   default=0,    type=int)
+    parser.add_argument("--uplink-quantum",    default=None, type=int, help="uplink arbitration quantum (default: timeout)")
+    parser.add_argument("--downlink-quantum",  default=None, type=int, help="downlink arbitration quantum (default: timeout)")
+    parser.add_argument("--adaptive",          action="store_true",    help="enable the adaptive arbitration")
+    parser.add_argument("--seed",              default=0,    type=int)
+    args = parser.parse_args()
+
+    csrs = {"adaptive": args.adaptive}
+    if args.uplink_quantum is not None:
+        csrs["uplink_quantum"] = args.uplink_quantum
+    if args.downlink_quantum is not None:
+        csrs["downlink_quantum"] = args.downlink_quantum
+
+    config = {
+        "timeout":           args.timeout,
+        "read_fifo_depth":   args.read_fifo_depth,
+        "write_fifo_depth":  args.write_fifo_depth,
+        "read_buffer_depth": args.read_buffer_depth,
+        "deep_fifo_depth":   args.deep_fifo_depth,
+    }
+    for workload in workloads.keys():
+        if args.workload not in [workload, "all"]:
+            continue
+        stats = run(workload, args.cycles, args.seed, args.host_rate,
+            (args.host_stall_probability, args.host_stall_length), csrs, **config)
+        print("{:10s}: uplink {:.3f} words/cycle, downlink {:.3f} words/cycle, errors {:d}/{:d}, "
+              "{:d} turnarounds ({:d} cycles)".format(
+            workload,
+            stats["uplink_received"]/stats["cycles"],
+            stats["downlink_received"]/stats["cycles"],
+            stats["uplink_errors"], stats["downlink_errors"],
+            stats["turnarounds"], stats["turnaround_cycles"]))
+
+if __name__ == "__main__":
+    main()
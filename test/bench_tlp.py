@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "software"))
+
+from tlp import *
+
+# Reference (per-field getattr/setattr) codec ------------------------------------------------------
+
+def legacy_decode_dwords(tlp):
+    for k, v in tlp_headers_dict[tlp.name].fields.items():
+        setattr(tlp, k, get_field_data(v, tlp.header))
+
+def legacy_encode_dwords(tlp, data=[]):
+    tlp.header = [0, 0, 0]
+    for k, v in tlp_headers_dict[tlp.name].fields.items():
+        tlp.header[v.byte//4] |= (getattr(tlp, k) << v.offset)
+    tlp.data = data
+    tlp.dwords = tlp.header + tlp.data
+    return tlp.dwords
+
+# Traffic ------------------------------------------------------------------------------------------
+
+def generate_tlps(n):
+    tlps = []
+    for i in range(n):
+        rd = RD32()
+        rd.fmt          = 0b00
+        rd.type         = 0b00000
+        rd.length       = 1
+        rd.first_be     = 0xf
+        rd.address      = i
+        rd.requester_id = 0x100
+        rd.tag          = i%32
+        tlps.append(rd.encode_dwords())
+        cpl = CPLD()
+        cpl.fmt           = 0b10
+        cpl.type          = 0b01010
+        cpl.length        = 1
+        cpl.completer_id  = 0x100
+        cpl.byte_count    = 4
+        cpl.tag           = i%32
+        cpl.lower_address = (4*i) & 0x7f
+        tlps.append(cpl.encode_dwords([i]))
+    return tlps
+
+# Benchmarks ---------------------------------------------------------------------------------------
+
+def bench(name, fn, items, duration, repeat=5):
+    rate = 0
+    for i in range(repeat):
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration/repeat:
+            for item in items:
+                fn(item)
+            count += len(items)
+        rate = max(rate, count/(time.perf_counter() - start))
+    print("{:<16s}: {:10.0f} packets/s".format(name, rate))
+    return rate
+
+def main():
+    parser = argparse.ArgumentParser(description="TLP header codec microbenchmark")
+    parser.add_argument("--packets",  default=1024, type=int,   help="number of packets per pass")
+    parser.add_argument("--duration", default=1.0,  type=float, help="duration of each benchmark (s)")
+    args = parser.parse_args()
+
+    tlps = generate_tlps(args.packets//2)
+
+    # check both codecs agree
+    for dwords in tlps:
+        tlp, length = parse_dwords(dwords)
+        ref = type(tlp)(dwords)
+        legacy_decode_dwords(ref)
+        assert ref.__dict__ == tlp.__dict__
+        assert legacy_encode_dwords(ref, tlp.data) == tlp.encode_dwords(tlp.data) == dwords
+
+    def legacy_decode(dwords):
+        f = get_field_data(tlp_common_header.fields["fmt"], dwords)
+        t = get_field_data(tlp_common_header.fields["type"], dwords)
+        tlp_cls, tlp_length = fmt_type_dict[(f << 5) | t]
+        tlp = tlp_cls.__new__(tlp_cls)
+        tlp.name   = tlp_cls.__name__
+        tlp.header = dwords[:3]
+        tlp.data   = dwords[3:]
+        tlp.dwords = tlp.header + tlp.data
+        legacy_decode_dwords(tlp)
+
+    def decode(dwords):
+        parse_dwords(dwords)
+
+    def legacy_encode(tlp):
+        legacy_encode_dwords(tlp, tlp.data)
+
+    def encode(tlp):
+        tlp.encode_dwords(tlp.data)
+
+    decoded = [parse_dwords(dwords)[0] for dwords in tlps]
+
+    print("Decode:")
+    before = bench("before", legacy_decode, tlps, args.duration)
+    after  = bench("after",  decode,        tlps, args.duration)
+    print("speedup         : {:10.2f}x".format(after/before))
+    print("Encode:")
+    before = bench("before", legacy_encode, decoded, args.duration)
+    after  = bench("after",  encode,        decoded, args.duration)
+    print("speedup         : {:10.2f}x".format(after/before))
+
+if __name__ == "__main__":
+    main()
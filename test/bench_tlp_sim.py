@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import random
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from migen import *
+from migen.sim import passive
+
+from litex.soc.interconnect import stream
+
+from gateware.usb import phy_description, USBCore
+from gateware.tlp import TLP
+
+sys_clk_freq = int(100e6)
+tlp_port     = 1
+usb_preamble = 0x5aa55aa5
+
+# DUT ----------------------------------------------------------------------------------------------
+
+class _PHY(Module):
+    def __init__(self):
+        self.sink = stream.Endpoint(phy_description(32))
+        self.source = stream.Endpoint(phy_description(32))
+
+
+class TLPDUT(Module):
+    def __init__(self, dw=32, with_aggregation=False, with_length=False):
+        self.submodules.phy = _PHY()
+        self.submodules.usb_core = USBCore(self.phy, sys_clk_freq, dw=dw)
+        self.submodules.tlp = TLP(self.usb_core, tlp_port,
+            with_aggregation = with_aggregation,
+            with_length      = with_length,
+            dw               = dw)
+
+# Generators ---------------------------------------------------------------------------------------
+
+def generate_tlps(rng, n, lengths):
+    return [[rng.getrandbits(32) for i in range(rng.choice(lengths))] for j in range(n)]
+
+
+def tlp_beats(dwords):
+    # 64-bit beats (dat, be, last) of a TLP.
+    beats = []
+    for i in range(0, len(dwords), 2):
+        if i + 1 < len(dwords):
+            beats.append((dwords[i] | (dwords[i + 1] << 32), 0xff, i + 2 == len(dwords)))
+        else:
+            beats.append((dwords[i], 0x0f, 1))
+    return beats
+
+
+@passive
+def send_tlps(sink, tlps, stats):
+    # TLPs from the PCIe core, sent back to back.
+    cycles = 0
+    for tlp in tlps:
+        for dat, be, last in tlp_beats(tlp):
+            yield sink.valid.eq(1)
+            yield sink.dat.eq(dat)
+            yield sink.be.eq(be)
+            yield sink.last.eq(last)
+            yield
+            cycles += 1
+            while not (yield sink.ready):
+                yield
+                cycles += 1
+    yield sink.valid.eq(0)
+    stats["ingress_cycles"] = cycles
+
+
+def receive_tlps(source, tlps, stats, max_cycles=1000000):
+    # TLPs from the host, to the PCIe core.
+    expected = [dword for tlp in tlps for dword in tlp]
+    received = []
+    cycle = 0
+    yield source.ready.eq(1)
+    while len(received) < len(expected) and cycle < max_cycles:
+        yield
+        cycle += 1
+        if (yield source.valid):
+            dat = (yield source.dat)
+            received.append(dat & 0xffffffff)
+            if (yield source.be) & 0xf0:
+                received.append(dat >> 32)
+    stats["downlink_errors"] += sum(a != b for a, b in zip(received, expected))
+    stats["downlink_errors"] += len(received) != len(expected)
+
+
+def usb_host(phy, uplink_tlps, downlink_tlps, rng, rate, with_aggregation, with_length, stats,
+    stall=0, max_cycles=1000000):
+    # FT601 host side: one 32-bit word per cycle (at rate) in each direction after stall cycles,
+    # the uplink USB packets are unframed and the dwords checked against the TLPs sent
+    # (with_length: the TLPs are also framed with their length dwords and checked against the
+    # TLPs lengths). Gives up after max_cycles (uplink/downlink lockup).
+    tx = []
+    for tlp in downlink_tlps:
+        tx += [usb_preamble, tlp_port, 4*len(tlp)] + tlp
+    expected = [dword for tlp in uplink_tlps for dword in tlp]
+    received = []
+    lengths = []
+    rx = []
+    cycle = 0
+    while (len(tx) or len(received) < len(expected)) and cycle < max_cycles:
+        enable = (cycle >= stall) and rng.random() < rate
+        yield phy.sink.ready.eq(enable)
+        yield phy.source.valid.eq(enable & (len(tx) != 0))
+        if len(tx):
+            yield phy.source.data.eq(tx[0])
+        yield
+        cycle += 1
+        if (yield phy.source.valid) and (yield phy.source.ready):
+            tx.pop(0)
+        if (yield phy.sink.valid) and (yield phy.sink.ready):
+            rx.append((yield phy.sink.data))
+            if len(rx) >= 3 and len(rx) == 3 + rx[2]//4:
+                assert rx[0] == usb_preamble and rx[1] == tlp_port
+                stats["max_packet_length"] = max(stats["max_packet_length"], rx[2])
+                words = rx[3:]
+                if with_aggregation:
+                    packets = []
+                    while len(words):
+                        length = words.pop(0)//4
+                        packets += words[:length]
+                        words = words[length:]
+                    words = packets
+                if with_length:
+                    while len(words):
+                        length = words.pop(0)
+                        lengths.append(length)
+                        received += words[:length]
+                        words = words[length:]
+                else:
+                    received += words
+                rx = []
+                if len(received) >= len(expected):
+                    stats["uplink_cycles"] = cycle
+    stats["uplink_errors"] = sum(a != b for a, b in zip(received, expected))
+    stats["uplink_errors"] += len(received) != len(expected)
+    if with_length:
+        stats["uplink_errors"] += sum(a != len(b) for a, b in zip(lengths, uplink_tlps))
+        stats["uplink_errors"] += len(lengths) != len(uplink_tlps)
+    yield phy.sink.ready.eq(0)
+    yield phy.source.valid.eq(0)
+
+# Run ----------------------------------------------------------------------------------------------
+
+def run(dw, ntlps, lengths, rate, with_aggregation, with_length, seed, stall=0, max_cycles=1000000):
+    rng = random.Random(seed)
+    dut = TLPDUT(dw, with_aggregation, with_length)
+    uplink_tlps = generate_tlps(rng, ntlps, lengths)
+    downlink_tlps = generate_tlps(rng, ntlps, lengths)
+    stats = {"ingress_cycles": 0, "uplink_cycles": 0, "uplink_errors": 0, "downlink_errors": 0,
+        "max_packet_length": 0}
+    generators = [
+        send_tlps(dut.tlp.sender.sink, uplink_tlps, stats),
+        receive_tlps(dut.tlp.receiver.source, downlink_tlps, stats, max_cycles),
+        usb_host(dut.phy, uplink_tlps, downlink_tlps, rng, rate, with_aggregation, with_length, stats,
+            stall, max_cycles),
+    ]
+    run_simulation(dut, generators)
+    stats["dwords"] = sum(len(tlp) for tlp in uplink_tlps)
+    return stats
+
+
+# Cases -------------------------------------------------------------------------------------------
+
+# name: arguments overridden by the case.
+cases = {
+    # the host stalls while short TLPs fill the sender fifo: the sender then sends USB packets
+    # that can exceed the aggregator max_length (uplink lockup before oversized packets bypass).
+    "stalled-host": {
+        "tlps": 300, "lengths": "3", "stall": 3000, "max_cycles": 20000,
+        "with_aggregation": True, "with_length": True,
+    },
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="TLP sender/receiver simulation benchmark (32/64-bit TLP path)")
+    parser.add_argument("--tlps",    default=64,          type=int,   help="TLPs sent in each direction")
+    parser.add_argument("--lengths", default="3,4,19,35",             help="TLP lengths in dwords")
+    parser.add_argument("--rate",    default=1.0,         type=float, help="probability the host transfers a word per cycle")
+    parser.add_argument("--with-aggregation", action="store_true",    help="aggregate TLPs in USB packets")
+    parser.add_argument("--with-length",      action="store_true",    help="precede each TLP with its length")
+    parser.add_argument("--stall",   default=0,           type=int,   help="cycles the host stalls before transferring")
+    parser.add_argument("--max-cycles", default=1000000,  type=int,   help="cycles before giving up (lockup)")
+    parser.add_argument("--seed",    default=0,           type=int)
+    parser.add_argument("--case",    default=None, choices=list(cases.keys()), help="run a predefined case")
+    args = parser.parse_args()
+    if args.case is not None:
+        for k, v in cases[args.case].items():
+            setattr(args, k, v)
+
+    lengths = [int(length) for length in args.lengths.split(",")]
+    # aggregation is only supported at 32-bit.
+    for dw in [32] if args.with_aggregation else [32, 64]:
+        stats = run(dw, args.tlps, lengths, args.rate, args.with_aggregation, args.with_length, args.seed,
+            args.stall, args.max_cycles)
+        print("{:d}-bit: {:d} dwords, ingress {:.3f} dwords/cycle, sustained {:.3f} dwords/cycle, "
+              "largest USB packet {:d} bytes, errors {:d}/{:d}".format(
+            dw, stats["dwords"],
+            stats["dwords"]/max(stats["ingress_cycles"], 1),
+            stats["dwords"]/stats["uplink_cycles"] if stats["uplink_cycles"] else 0,
+            stats["max_packet_length"],
+            stats["uplink_errors"], stats["downlink_errors"]))
+
+if __name__ == "__main__":
+    main()
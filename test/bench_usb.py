@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+from collections import deque
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "software"))
+
+from litex.soc.tools.remote.etherbone import *
+
+from transport import open_transport
+from etherbone import etherbone_max_count
+from ft60x import ft60x_header
+
+# Paths --------------------------------------------------------------------------------------------
+
+class LoopbackPath:
+    # --with-loopback gateware: USB packets are sent back by usb_loopback_fifo (2048 dwords).
+    fifo_bytes = 2048*4
+
+    def __init__(self, transport_name):
+        self.transport = open_transport(transport_name, "wishbone")
+        self.expected = deque()
+
+    def max_window(self, size):
+        # the host does not read while writing: in flight packets must fit in the loopback fifo.
+        return max(1, self.fifo_bytes//(size + ft60x_header.size))
+
+    def payload_size(self, size):
+        return size
+
+    def send(self, size, seq):
+        payload = seq.to_bytes(4, byteorder="little") + bytes(size - 4)
+        self.expected.append(payload)
+        self.transport.send(payload)
+
+    def recv(self):
+        data = self.transport.recv(2**16)
+        if data != self.expected.popleft():
+            raise ValueError("Loopback data mismatch")
+        return len(data)
+
+
+class CorePath:
+    # Full USBCore path (crossbar, Etherbone): each packet is an Etherbone record of size//4
+    # reads of address, answered by a record of size//4 datas.
+    def __init__(self, transport_name, address):
+        self.transport = open_transport(transport_name, "wishbone")
+        self.address = address
+        self.packets = {}
+
+    def max_window(self, size):
+        return 2**16
+
+    def payload_size(self, size):
+        return 4*self.count(size)
+
+    def count(self, size):
+        return min(max(size//4, 1), etherbone_max_count)
+
+    def send(self, size, seq):
+        if size not in self.packets:
+            count = self.count(size)
+            record = EtherboneRecord()
+            record.reads = EtherboneReads(base_ret_addr=0, addrs=[self.address]*count)
+            record.rcount = count
+            packet = EtherbonePacket()
+            packet.records = [record]
+            packet.encode()
+            self.packets[size] = bytes(packet)
+        self.transport.send(self.packets[size])
+
+    def recv(self):
+        packet = EtherbonePacket(self.transport.recv(4096))
+        packet.decode()
+        return 4*packet.records[0].wcount
+
+# Measurements -------------------------------------------------------------------------------------
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values)*p/100))]
+
+
+def measure_latency(path, size, count):
+    latencies = []
+    for seq in range(count):
+        start = time.perf_counter()
+        path.send(size, seq)
+        path.recv()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "mean": 1e6*sum(latencies)/len(latencies),
+        "p50":  1e6*percentile(latencies, 50),
+        "p90":  1e6*percentile(latencies, 90),
+        "p99":  1e6*percentile(latencies, 99),
+        "max":  1e6*latencies[-1],
+    }
+
+
+def measure_throughput(path, size, count, window):
+    sent = 0
+    received = 0
+    nbytes = 0
+    start = time.perf_counter()
+    while received < count:
+        while sent < count and sent - received < window:
+            path.send(size, sent)
+            sent += 1
+        nbytes += path.recv()
+        received += 1
+    duration = time.perf_counter() - start
+    return {
+        "mbps": nbytes/duration/1e6,
+        "pps":  count/duration,
+    }
+
+# Run ----------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="USB framing path throughput/latency benchmark")
+    parser.add_argument("--path",      default="loopback", choices=["loopback", "core"],
+        help="loopback: --with-loopback gateware, core: USBCore/Etherbone gateware")
+    parser.add_argument("--transport", default="ft60x",
+        help="udp[:ip] (usb2udp), ft60x[:device], sim (core) or sim-loopback (loopback)")
+    parser.add_argument("--sizes",     default="64,256,1024,4096", help="packet payload sizes in bytes")
+    parser.add_argument("--count",     default=10000, type=int, help="packets per throughput measurement")
+    parser.add_argument("--latency-count", default=1000, type=int, help="round trips per latency measurement")
+    parser.add_argument("--window",    default=8, type=int, help="maximum number of packets in flight")
+    parser.add_argument("--address",   default="0xe0000004", help="wishbone address read by the core path (ctrl_scratch)")
+    parser.add_argument("--build",     default="", help="gateware build identifier stored with the results")
+    parser.add_argument("--output",    default=None, help="append the results as a JSON line to this file")
+    args = parser.parse_args()
+
+    if args.path == "loopback":
+        path = LoopbackPath(args.transport)
+    else:
+        path = CorePath(args.transport, int(args.address, 0))
+
+    results = []
+    for size in [int(size) for size in args.sizes.split(",")]:
+        assert size >= 4 and size%4 == 0
+        window = min(args.window, path.max_window(size))
+        result = {"size": path.payload_size(size), "window": window}
+        result.update(measure_throughput(path, size, args.count, window))
+        result["latency_us"] = measure_latency(path, size, args.latency_count)
+        results.append(result)
+        print("{:5d} bytes: {:8.2f} MB/s {:10.0f} packets/s latency (us) p50 {:8.1f} p90 {:8.1f} p99 {:8.1f} max {:8.1f}".format(
+            result["size"], result["mbps"], result["pps"],
+            result["latency_us"]["p50"], result["latency_us"]["p90"],
+            result["latency_us"]["p99"], result["latency_us"]["max"]))
+
+    if args.output is not None:
+        run = {
+            "date":      datetime.datetime.now().isoformat(),
+            "build":     args.build,
+            "path":      args.path,
+            "transport": args.transport,
+            "results":   results,
+        }
+        with open(args.output, "a") as f:
+            f.write(json.dumps(run) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import random
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from migen import *
+from migen.sim import passive
+
+from litex.soc.interconnect import stream
+
+from gateware.usb import phy_description, USBPacketizer, USBDepacketizer, USBAggregator, USBCore
+
+sys_clk_freq = int(100e6)
+
+# DUTs ---------------------------------------------------------------------------------------------
+
+class _Link(Module):
+    # phy link between packetizer and depacketizer, throttled by enable (backpressure).
+    def __init__(self, source, sink):
+        self.enable = Signal()
+        self.comb += [
+            sink.valid.eq(source.valid & self.enable),
+            sink.data.eq(source.data),
+            source.ready.eq(sink.ready & self.enable)
+        ]
+
+
+class PacketizerDUT(Module):
+    def __init__(self):
+        self.submodules.packetizer = USBPacketizer()
+        self.submodules.depacketizer = USBDepacketizer(sys_clk_freq)
+        self.submodules.link = _Link(self.packetizer.source, self.depacketizer.sink)
+        self.sinks = {0: self.packetizer.sink}
+        self.sources = {0: self.depacketizer.source}
+
+
+class AggregatorDUT(PacketizerDUT):
+    def __init__(self):
+        PacketizerDUT.__init__(self)
+        self.submodules.aggregator = USBAggregator()
+        self.comb += self.aggregator.source.connect(self.packetizer.sink)
+        self.sinks = {0: self.aggregator.sink}
+        self.aggregated = True
+
+
+class _LoopbackPHY(Module):
+    def __init__(self):
+        self.sink = stream.Endpoint(phy_description(32))
+        self.source = stream.Endpoint(phy_description(32))
+        self.submodules.link = _Link(self.sink, self.source)
+
+
+class USBCoreDUT(Module):
+    def __init__(self, nports=2):
+        self.submodules.phy = _LoopbackPHY()
+        self.submodules.usb_core = USBCore(self.phy, sys_clk_freq)
+        self.packetizer = self.usb_core.packetizer
+        self.link = self.phy.link
+        ports = {i: self.usb_core.crossbar.get_port(i) for i in range(nports)}
+        self.sinks = {i: port.sink for i, port in ports.items()}
+        self.sources = {i: port.source for i, port in ports.items()}
+
+# Generators ---------------------------------------------------------------------------------------
+
+def generate_packets(rng, dst, npackets, min_length, max_length):
+    return [(dst, [rng.getrandbits(32) for i in range(rng.randint(min_length, max_length))])
+        for n in range(npackets)]
+
+
+def send_packets(sink, packets, rng, valid_rate):
+    for dst, datas in packets:
+        i = 0
+        while i < len(datas):
+            valid = rng.random() < valid_rate
+            yield sink.valid.eq(valid)
+            yield sink.dst.eq(dst)
+            yield sink.length.eq(4*len(datas))
+            yield sink.data.eq(datas[i])
+            yield sink.last.eq(i == len(datas) - 1)
+            yield
+            if valid and (yield sink.ready):
+                i += 1
+    yield sink.valid.eq(0)
+
+
+def receive_packets(source, packets, rng, ready_rate, stats):
+    for dst, datas in packets:
+        received = []
+        while len(received) < len(datas):
+            yield source.ready.eq(rng.random() < ready_rate)
+            yield
+            if (yield source.valid) and (yield source.ready):
+                received.append((yield source.data))
+                last = (yield source.last)
+                assert (yield source.dst) == dst
+                assert (yield source.length) == 4*len(datas)
+                assert last == (len(received) == len(datas)), "last mismatch"
+        assert received == datas, "data mismatch"
+        stats["packets"] += 1
+        stats["words"] += len(datas)
+    yield source.ready.eq(0)
+
+
+def receive_aggregated_packets(source, packets, rng, ready_rate, stats):
+    # USB packets with USBAggregator sub-headers (length in bytes + payload).
+    received = []
+    while len(received) < len(packets):
+        words = []
+        last = 0
+        while not last:
+            yield source.ready.eq(rng.random() < ready_rate)
+            yield
+            if (yield source.valid) and (yield source.ready):
+                words.append((yield source.data))
+                last = (yield source.last)
+        assert (yield source.length) == 4*len(words)
+        while len(words):
+            length = words.pop(0)//4
+            received.append(words[:length])
+            words = words[length:]
+    for (dst, datas), data in zip(packets, received):
+        assert data == datas, "data mismatch"
+        stats["packets"] += 1
+        stats["words"] += len(datas)
+    yield source.ready.eq(0)
+
+
+@passive
+def throttle_link(link, rng, ready_rate):
+    while True:
+        yield link.enable.eq(rng.random() < ready_rate)
+        yield
+
+
+@passive
+def monitor(dut, stats):
+    packetizer = dut.packetizer
+    while True:
+        yield
+        stats["cycles"] += 1
+        sink_valid   = (yield packetizer.sink.valid)
+        sink_ready   = (yield packetizer.sink.ready)
+        source_valid = (yield packetizer.source.valid)
+        source_ready = (yield packetizer.source.ready)
+        if source_valid and source_ready:
+            stats["link_words"] += 1
+        # cycles where payload is available and the link can accept it but no payload is sent
+        # (packetizer IDLE/INSERT_HEADER states).
+        if sink_valid and source_ready and not sink_ready:
+            stats["bubbles"] += 1
+
+# Run ----------------------------------------------------------------------------------------------
+
+def run(dut, npackets, min_length, max_length, valid_rate, ready_rate, seed):
+    rng = random.Random(seed)
+    stats = {"packets": 0, "words": 0, "cycles": 0, "link_words": 0, "bubbles": 0}
+    generators = [throttle_link(dut.link, rng, ready_rate), monitor(dut, stats)]
+    for dst, sink in dut.sinks.items():
+        packets = generate_packets(rng, dst, npackets, min_length, max_length)
+        generators.append(send_packets(sink, packets, rng, valid_rate))
+        if getattr(dut, "aggregated", False):
+            generators.append(receive_aggregated_packets(dut.sources[dst], packets, rng, ready_rate, stats))
+        else:
+            generators.append(receive_packets(dut.sources[dst], packets, rng, ready_rate, stats))
+    run_simulation(dut, generators)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="USBPacketizer/USBDepacketizer/USBCore simulation benchmark")
+    parser.add_argument("--dut",        default="all", choices=["packetizer", "aggregator", "core", "all"])
+    parser.add_argument("--packets",    default=200, type=int,   help="packets per port")
+    parser.add_argument("--min-length", default=1,   type=int,   help="minimum packet length in dwords")
+    parser.add_argument("--max-length", default=64,  type=int,   help="maximum packet length in dwords")
+    parser.add_argument("--valid-rate", default=1.0, type=float, help="probability of valid on the user sinks")
+    parser.add_argument("--ready-rate", default=1.0, type=float, help="probability of ready on the link/user sources")
+    parser.add_argument("--seed",       default=0,   type=int)
+    args = parser.parse_args()
+
+    duts = {
+        "packetizer": PacketizerDUT,
+        "aggregator": AggregatorDUT,
+        "core":       USBCoreDUT,
+    }
+    for name, dut_cls in duts.items():
+        if args.dut not in [name, "all"]:
+            continue
+        stats = run(dut_cls(), args.packets, args.min_length, args.max_length, args.valid_rate, args.ready_rate, args.seed)
+        print("{:10s}: {:d} packets, {:d} words in {:d} cycles: {:.3f} words/cycle, link {:.3f} words/cycle, {:.2f} bubble cycles/packet".format(
+            name, stats["packets"], stats["words"], stats["cycles"],
+            stats["words"]/stats["cycles"],
+            stats["link_words"]/stats["cycles"],
+            stats["bubbles"]/stats["packets"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import random
+
+from migen import *
+from migen.sim import passive
+from migen.fhdl.specials import Tristate
+
+from litex.soc.interconnect import stream
+from litex.soc.cores.usb_fifo import phy_description
+
+# Pads ---------------------------------------------------------------------------------------------
+
+def ft601_pads(dw=32):
+    pads = Record([
+        ("rst",   1),
+        ("data",  dw),
+        ("be",    dw//8),
+        ("rxf_n", 1),
+        ("txe_n", 1),
+        ("rd_n",  1),
+        ("wr_n",  1),
+        ("oe_n",  1),
+        ("siwua", 1),
+    ])
+    # strobes are idle (high) on reset.
+    for strobe in [pads.rd_n, pads.wr_n, pads.oe_n]:
+        strobe.reset = 1
+    return pads
+
+# Simulation lowering of the FT601Sync IOs ---------------------------------------------------------
+
+class _SimTristate:
+    # the model drives the pads when the FPGA does not (FT601Sync.tdata_w/data_oe are read by the
+    # model directly).
+    @staticmethod
+    def lower(tristate):
+        m = Module()
+        m.comb += tristate.i.eq(tristate.target)
+        return m
+
+
+class _SimODDR:
+    # ODDR with D1 = D2 delayed by one cycle (as used by FT601Sync): seen by the FT601 on the next
+    # rising edge as a D2 register.
+    @staticmethod
+    def lower(instance):
+        assert instance.of == "ODDR"
+        ports = {item.name: item.expr for item in instance.items
+            if isinstance(item, (Instance.Input, Instance.Output))}
+        m = Module()
+        m.sync.usb += ports["Q"].eq(ports["D2"])
+        return m
+
+
+ft601_special_overrides = {
+    Tristate: _SimTristate,
+    Instance: _SimODDR,
+}
+
+# FT601 Model --------------------------------------------------------------------------------------
+
+class FT601Model(Module):
+    # FT601 245 synchronous FIFO mode (usb domain). The host writes the words sent to the FPGA to
+    # host_sink and reads the words written by the FPGA from host_source, rx_depth/tx_depth are
+    # the sizes of the FT601 buffers.
+    #   - rxf_n/txe_n are low when the rx buffer is not empty/the tx buffer is not full.
+    #   - the rx buffer drives the bus when oe_n is low, a word is read on each rising edge with
+    #     rd_n, oe_n and rxf_n low.
+    #   - a word is written on each rising edge with wr_n and txe_n low.
+    # violations counts the cycles where the FPGA breaks the protocol (rd_n low with oe_n high,
+    # wr_n low with oe_n low: both sides driving the bus).
+    def __init__(self, pads, phy, dw=32, rx_depth=1024, tx_depth=1024):
+        self.host_sink = stream.Endpoint(phy_description(dw))
+        self.host_source = stream.Endpoint(phy_description(dw))
+        self.violations = Signal(32)
+
+        # # #
+
+        rx_fifo = ClockDomainsRenamer("usb")(stream.SyncFIFO(phy_description(dw), rx_depth))
+        tx_fifo = ClockDomainsRenamer("usb")(stream.SyncFIFO(phy_description(dw), tx_depth))
+        self.submodules += rx_fifo, tx_fifo
+
+        self.comb += [
+            # Host --> FT601 --> FPGA
+            self.host_sink.connect(rx_fifo.sink),
+            pads.rxf_n.eq(~rx_fifo.source.valid),
+            If(~pads.oe_n,
+                pads.data.eq(rx_fifo.source.data)
+            ),
+            rx_fifo.source.ready.eq(~pads.rd_n & ~pads.oe_n & ~pads.rxf_n),
+
+            # FPGA --> FT601 --> Host
+            pads.txe_n.eq(~tx_fifo.sink.ready),
+            tx_fifo.sink.valid.eq(~pads.wr_n & ~pads.txe_n),
+            tx_fifo.sink.data.eq(phy.tdata_w),
+            tx_fifo.source.connect(self.host_source)
+        ]
+        self.sync.usb += [
+            If((~pads.rd_n & pads.oe_n) | (~pads.wr_n & ~pads.oe_n),
+                self.violations.eq(self.violations + 1)
+            )
+        ]
+
+# Host ---------------------------------------------------------------------------------------------
+
+class Throttle:
+    # host (or FPGA user logic) bandwidth: a transfer is allowed on a cycle with probability rate,
+    # outside of stall bursts (started with probability stall_probability per cycle, 1 to
+    # stall_length cycles long, e.g. the host serving other USB endpoints).
+    def __init__(self, rng, rate=1.0, stall_probability=0.0, stall_length=0):
+        self.rng = rng
+        self.rate = rate
+        self.stall_probability = stall_probability
+        self.stall_length = stall_length
+        self.stall = 0
+
+    def __call__(self):
+        if self.stall:
+            self.stall -= 1
+            return False
+        if self.stall_length and self.rng.random() < self.stall_probability:
+            self.stall = self.rng.randint(1, self.stall_length) - 1
+            return False
+        return self.rng.random() < self.rate
+
+
+# Words are consecutive values of a counter per direction, so that lost or duplicated words are
+# detected on the receive side.
+
+@passive
+def send_words(sink, throttle, stats, name, count=None):
+    n = 0
+    while True:
+        yield sink.valid.eq(throttle() and (count is None or n < count))
+        yield sink.data.eq(n)
+        yield
+        if (yield sink.valid) and (yield sink.ready):
+            n = (n + 1) & 0xffffffff
+            stats[name + "_sent"] += 1
+
+
+@passive
+def receive_words(source, throttle, stats, name):
+    n = 0
+    while True:
+        yield source.ready.eq(throttle())
+        yield
+        if (yield source.valid) and (yield source.ready):
+            if (yield source.data) != n:
+                stats[name + "_errors"] += 1
+            n = ((yield source.data) + 1) & 0xffffffff
+            stats[name + "_received"] += 1
@@ -0,0 +1,41 @@
+import time
+
+from litex import RemoteClient
+
+wb = RemoteClient()
+wb.open()
+
+# # #
+
+# DDR3 must be initialized/calibrated first (see test_sdram.py).
+
+# capture the TLPs following the first memory write to 0x00000000-0x0fffffff in DDR3 until
+# the buffer is full, then drain them to the host.
+wb.regs.tlp_capture_trigger_fmt_type.write(0b1000000) # mem_wr32
+wb.regs.tlp_capture_trigger_fmt_type_mask.write(0b1111111)
+wb.regs.tlp_capture_trigger_address_min.write(0x00000000)
+wb.regs.tlp_capture_trigger_address_max.write(0x0fffffff)
+wb.regs.tlp_capture_trigger_enable.write(1)
+wb.regs.tlp_capture_mode.write(2) # trigger
+wb.regs.tlp_capture_drain.write(0)
+wb.regs.tlp_capture_enable.write(1)
+wb.regs.tlp_capture_start.write(1)
+
+while not wb.regs.tlp_capture_done.read():
+    print("triggered: {:d} level: {:d} captured: {:d} dropped: {:d}".format(
+        wb.regs.tlp_capture_triggered.read(),
+        wb.regs.tlp_capture_level.read(),
+        wb.regs.tlp_capture_captured.read(),
+        wb.regs.tlp_capture_dropped.read()))
+    time.sleep(1)
+
+wb.regs.tlp_capture_drain.write(1)
+while wb.regs.tlp_capture_level.read():
+    print("draining, level: {:d}".format(wb.regs.tlp_capture_level.read()))
+    time.sleep(1)
+
+wb.regs.tlp_capture_enable.write(0)
+
+# # #
+
+wb.close()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import random
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from migen import *
+from migen.sim import passive
+
+from litedram.common import LiteDRAMNativePort
+
+from gateware.capture import capture_continuous, capture_stop_on_full, capture_trigger, TLPCapture
+
+from tlp_model import mem_rd32, mem_wr32, send_tlps, receive_tlps, run_scenarios
+
+depth         = 64
+max_tlp_beats = 8
+
+# DUT ----------------------------------------------------------------------------------------------
+
+class CaptureDUT(Module):
+    def __init__(self):
+        self.write_port = LiteDRAMNativePort("write", address_width=24, data_width=128)
+        self.read_port  = LiteDRAMNativePort("read",  address_width=24, data_width=128)
+        self.submodules.capture = TLPCapture(self.write_port, self.read_port,
+            base          = 0,
+            depth         = depth,
+            max_tlp_beats = max_tlp_beats)
+
+# DRAM Model ---------------------------------------------------------------------------------------
+
+@passive
+def dram(write_port, read_port, rng, latency=8):
+    # DRAM native ports: commands accepted at random, reads returned after latency cycles (and
+    # once the data of a pending write to the same address is received).
+    memory = {}
+    writes = []
+    reads  = []
+    cycle  = 0
+    while True:
+        yield write_port.cmd.ready.eq(rng.random() < 0.8)
+        yield write_port.wdata.ready.eq(len(writes) != 0 and rng.random() < 0.8)
+        yield read_port.cmd.ready.eq(rng.random() < 0.8)
+        ready = len(reads) != 0 and reads[0][1] <= cycle and reads[0][0] not in writes
+        yield read_port.rdata.valid.eq(ready)
+        if ready:
+            yield read_port.rdata.data.eq(memory[reads[0][0]])
+        yield
+        cycle += 1
+        if (yield write_port.wdata.valid) and (yield write_port.wdata.ready):
+            memory[writes.pop(0)] = (yield write_port.wdata.data)
+        if (yield write_port.cmd.valid) and (yield write_port.cmd.ready):
+            writes.append((yield write_port.cmd.addr))
+        if (yield read_port.rdata.valid) and (yield read_port.rdata.ready):
+            reads.pop(0)
+        if (yield read_port.cmd.valid) and (yield read_port.cmd.ready):
+            reads.append(((yield read_port.cmd.addr), cycle + latency))
+
+# Scenarios ----------------------------------------------------------------------------------------
+
+# name: capture mode.
+scenarios = {
+    "continuous":   capture_continuous,
+    "stop-on-full": capture_stop_on_full,
+    "trigger":      capture_trigger,
+}
+
+
+def beats(tlp):
+    return (len(tlp) + 1)//2
+
+
+def random_tlp(rng, trigger=False):
+    if trigger:
+        return mem_wr32(0x1000 + 4*rng.randrange(1024), [rng.getrandbits(32) for i in range(rng.randint(1, 5))])
+    if rng.random() < 0.5:
+        return mem_rd32(0x8000 + 4*rng.randrange(1024), length=rng.randint(1, 8))
+    return mem_wr32(0x8000 + 4*rng.randrange(1024), [rng.getrandbits(32) for i in range(rng.randint(1, 5))])
+
+
+def expected_capture(mode, tlps, triggers):
+    # captured TLPs, dropped count and done status (buffer not drained while capturing).
+    captured = []
+    dropped  = 0
+    level    = 0
+    running  = True
+    triggered = False
+    for tlp, trigger in zip(tlps, triggers):
+        if not running:
+            continue
+        if mode == capture_trigger and not (triggered or trigger):
+            continue
+        triggered = True
+        if level <= depth - max_tlp_beats:
+            captured.append(tlp)
+            level += beats(tlp)
+        else:
+            dropped += 1
+            running = False
+    return captured, dropped, not running
+
+# Test ---------------------------------------------------------------------------------------------
+
+def run_scenario(scenario, seed, rate, ntlps=48):
+    rng = random.Random(seed)
+    mode = scenarios[scenario]
+    dut = CaptureDUT()
+    capture = dut.capture
+    triggers = [False]*8 + [True] + [rng.random() < 0.2 for i in range(ntlps - 9)]
+    tlps = [random_tlp(rng, trigger) for trigger in triggers]
+    received = []
+    status = {}
+    def generator():
+        yield capture.trigger.fmt_type.storage.eq(0b1000000) # mem_wr32
+        yield capture.trigger.fmt_type_mask.storage.eq(0b1111111)
+        yield capture.trigger.address_min.storage.eq(0x1000)
+        yield capture.trigger.address_max.storage.eq(0x1fff)
+        yield capture.trigger.enable.storage.eq(1)
+        yield capture.mode.storage.eq(mode)
+        yield capture.drain.storage.eq(mode == capture_continuous)
+        yield capture.enable.storage.eq(1)
+        yield capture.start.re.eq(1)
+        yield
+        yield capture.start.re.eq(0)
+        yield from send_tlps(capture.sink, tlps, rng, rate)
+        for i in range(64):
+            yield
+        for name in ["triggered", "done", "captured", "dropped"]:
+            status[name] = (yield getattr(capture, name).status)
+        # drain the buffer.
+        yield capture.drain.storage.eq(1)
+        cycles = 0
+        while ((yield capture.level.status) or len(received) < status["captured"]) and cycles < 10000:
+            yield
+            cycles += 1
+        status["level"] = (yield capture.level.status)
+    run_simulation(dut, [
+        generator(),
+        receive_tlps(capture.source, received, rng, rate),
+        dram(dut.write_port, dut.read_port, rng),
+    ])
+    errors = 0
+    if mode == capture_continuous:
+        # the TLPs are drained while captured: the ones dropped (buffer full) depend on the
+        # backpressure, the captured ones must be received in order.
+        i = 0
+        for tlp in received:
+            while i < len(tlps) and tlps[i] != tlp:
+                i += 1
+            i += 1
+        if i > len(tlps) or len(received) != status["captured"]:
+            print("  received TLPs are not the captured ones")
+            errors += 1
+        if status["captured"] + status["dropped"] != len(tlps):
+            print("  captured {:d} + dropped {:d} != {:d} TLPs".format(
+                status["captured"], status["dropped"], len(tlps)))
+            errors += 1
+    else:
+        captured, dropped, done = expected_capture(mode, tlps, triggers)
+        if received != captured:
+            print("  {:d}/{:d} TLPs received, {:d} differ".format(len(received), len(captured),
+                sum(a != b for a, b in zip(received, captured))))
+            errors += 1
+        expected = {"captured": len(captured), "dropped": dropped, "done": done,
+            "triggered": mode == capture_trigger}
+        for name, value in expected.items():
+            if status[name] != value:
+                print("  {}: {:d} (expected {:d})".format(name, status[name], value))
+                errors += 1
+    if status["level"]:
+        print("  {:d} beats left in the buffer".format(status["level"]))
+        errors += 1
+    return errors
+
+
+def main():
+    run_scenarios("TLPCapture simulation test (capture modes)", scenarios, run_scenario, seeds=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import time
+
+from litex import RemoteClient
+
+wb = RemoteClient()
+wb.open()
+
+# # #
+
+# only forward memory writes to 0x00000000-0x0fffffff, drop everything else.
+wb.regs.tlp_filter_rule0_fmt_type.write(0b1000000) # mem_wr32
+wb.regs.tlp_filter_rule0_fmt_type_mask.write(0b1111111)
+wb.regs.tlp_filter_rule0_address_min.write(0x00000000)
+wb.regs.tlp_filter_rule0_address_max.write(0x0fffffff)
+wb.regs.tlp_filter_rule0_action.write(0) # pass
+wb.regs.tlp_filter_rule0_enable.write(1)
+wb.regs.tlp_filter_default_action.write(1) # drop
+
+for i in range(10):
+    print("passed: {:d} dropped: {:d} rule0 matches: {:d}".format(
+        wb.regs.tlp_filter_passed.read(),
+        wb.regs.tlp_filter_dropped.read(),
+        wb.regs.tlp_filter_rule0_matches.read()))
+    time.sleep(1)
+
+wb.regs.tlp_filter_rule0_enable.write(0)
+wb.regs.tlp_filter_default_action.write(0) # pass
+
+# # #
+
+wb.close()
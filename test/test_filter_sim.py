@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import random
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from migen import *
+
+from gateware.filter import filter_pass, filter_drop, filter_count, TLPFilter
+
+from tlp_model import mem_rd32, mem_wr32, send_tlps, receive_tlps, run_scenarios
+
+# Scenarios ----------------------------------------------------------------------------------------
+
+# name: (default action, rules CSRs, TLPs (dwords, passed), expected counters).
+scenarios = {
+    # only forward memory writes to 0x00000000-0x0fffffff (as test_filter.py), rule0 counts all the
+    # memory writes.
+    "pass": (filter_drop, [
+            {"fmt_type": 0b1000000, "fmt_type_mask": 0x7f, "action": filter_count},
+            {"fmt_type": 0b1000000, "fmt_type_mask": 0x7f, "address_min": 0x00000000,
+             "address_max": 0x0fffffff, "action": filter_pass},
+        ], [
+            (mem_wr32(0x00000100, [0x11111111]), True),
+            (mem_rd32(0x00000100), False),
+            (mem_wr32(0x20000000, [0x22222222, 0x33333333]), False),
+            (mem_wr32(0x0ffffffc, [0x44444444, 0x55555555, 0x66666666]), True),
+            (mem_wr32(0x10000000, [0x77777777]), False),
+        ], {"passed": 2, "dropped": 3, "rule0_matches": 4, "rule1_matches": 2}),
+    # drop the memory writes of requester 0x0200, forward everything else.
+    "drop": (filter_pass, [
+            {"fmt_type": 0b1000000, "fmt_type_mask": 0x7f, "requester_id": 0x0200,
+             "requester_id_mask": 0xffff, "action": filter_drop},
+        ], [
+            (mem_wr32(0x00001000, [0x11111111, 0x22222222], requester_id=0x0200), False),
+            (mem_wr32(0x00001000, [0x33333333], requester_id=0x0100), True),
+            (mem_rd32(0x00001000, requester_id=0x0200), True),
+            (mem_wr32(0x00002000, [0x44444444], requester_id=0x0200, tag=1), False),
+        ], {"passed": 2, "dropped": 2, "rule0_matches": 2}),
+}
+
+# Test ---------------------------------------------------------------------------------------------
+
+def configure(dut, default_action, rules):
+    yield dut.default_action.storage.eq(default_action)
+    for rule, csrs in zip(dut.rules, rules):
+        for name, value in csrs.items():
+            yield getattr(rule, name).storage.eq(value)
+        yield rule.enable.storage.eq(1)
+    yield
+
+
+def run_scenario(scenario, seed, rate):
+    rng = random.Random(seed)
+    default_action, rules, tlps, counters = scenarios[scenario]
+    dut = TLPFilter()
+    received = []
+    status = {}
+    def generator():
+        yield from configure(dut, default_action, rules)
+        yield from send_tlps(dut.sink, [tlp for tlp, passed in tlps], rng, rate)
+        for i in range(16):
+            yield
+        status["passed"] = (yield dut.passed.status)
+        status["dropped"] = (yield dut.dropped.status)
+        for i, rule in enumerate(dut.rules):
+            status["rule{:d}_matches".format(i)] = (yield rule.matches.status)
+    run_simulation(dut, [generator(), receive_tlps(dut.source, received, rng, rate)])
+    errors = 0
+    expected = [tlp for tlp, passed in tlps if passed]
+    if received != expected:
+        print("  {:d}/{:d} TLPs forwarded, {:d} differ".format(len(received), len(expected),
+            sum(a != b for a, b in zip(received, expected))))
+        errors += 1
+    for name, value in counters.items():
+        if status[name] != value:
+            print("  {}: {:d} (expected {:d})".format(name, status[name], value))
+            errors += 1
+    return errors
+
+
+def main():
+    run_scenarios("TLPFilter simulation test (pass/drop actions and counters)", scenarios, run_scenario)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import random
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from migen import *
+
+from ft601_model import ft601_special_overrides, Throttle, send_words, receive_words
+from bench_ft601_sim import FT601DUT
+
+# Scenarios ----------------------------------------------------------------------------------------
+
+# name: (FT601Sync parameters, CSRs, throttles (rate, stall probability, stall length) of the
+# FPGA uplink sender/downlink receiver and of the host uplink receiver/downlink sender).
+scenarios = {
+    "default":      ({}, {}, {}),
+    "backpressure": ({}, {"adaptive": 1}, {
+        "fpga_send":    (0.8, 0.01, 64),
+        "fpga_receive": (0.7, 0.01, 64),
+        "host_receive": (0.6, 0.01, 256),
+        "host_send":    (0.9, 0.01, 256),
+    }),
+    "short-quanta": ({"read_buffer_depth": 2}, {"uplink_quantum": 8, "downlink_quantum": 8}, {
+        "fpga_send":    (0.9, 0.02, 16),
+        "fpga_receive": (0.5, 0.02, 16),
+        "host_receive": (0.9, 0.02, 16),
+        "host_send":    (0.5, 0.02, 16),
+    }),
+    "small-fifos":  ({"read_fifo_depth": 8, "write_fifo_depth": 8}, {}, {
+        "fpga_send":    (0.5, 0.05, 32),
+        "fpga_receive": (0.5, 0.05, 32),
+        "host_receive": (0.5, 0.05, 32),
+        "host_send":    (0.5, 0.05, 32),
+    }),
+    "deep-fifos":   ({"deep_fifo_depth": 256}, {"adaptive": 1}, {
+        "fpga_send":    (1.0, 0.01, 128),
+        "fpga_receive": (0.3, 0.01, 128),
+        "host_receive": (0.3, 0.01, 128),
+        "host_send":    (1.0, 0.01, 128),
+    }),
+}
+
+# Test ---------------------------------------------------------------------------------------------
+
+def wait_done(phy, model, words, max_cycles, stats, csrs):
+    for name, value in csrs.items():
+        yield getattr(phy, name).storage.eq(value)
+    cycles = 0
+    while (stats["uplink_received"] < words or stats["downlink_received"] < words) and cycles < max_cycles:
+        yield
+        cycles += 1
+    stats["cycles"] = cycles
+    stats["violations"] = (yield model.violations)
+
+
+def run_scenario(scenario, words, seed):
+    rng = random.Random(seed)
+    kwargs, csrs, throttles = scenarios[scenario]
+    def throttle(name):
+        return Throttle(rng, *throttles.get(name, (1.0, 0.0, 0)))
+    dut = FT601DUT(**kwargs)
+    stats = {}
+    for name in ["uplink", "downlink"]:
+        for k in ["sent", "received", "errors"]:
+            stats[name + "_" + k] = 0
+    generators = {
+        "sys": [
+            wait_done(dut.phy, dut.model, words, 100*words, stats, csrs),
+            send_words(dut.phy.sink, throttle("fpga_send"), stats, "uplink", words),
+            receive_words(dut.phy.source, throttle("fpga_receive"), stats, "downlink"),
+        ],
+        "usb": [
+            send_words(dut.model.host_sink, throttle("host_send"), stats, "downlink", words),
+            receive_words(dut.model.host_source, throttle("host_receive"), stats, "uplink"),
+        ]
+    }
+    run_simulation(dut, generators, clocks={"sys": 10, "usb": 10},
+        special_overrides=ft601_special_overrides)
+    errors = 0
+    for name in ["uplink", "downlink"]:
+        if stats[name + "_received"] != words:
+            print("  {}: {:d}/{:d} words received".format(name, stats[name + "_received"], words))
+            errors += 1
+        if stats[name + "_errors"]:
+            print("  {}: {:d} out of sequence words".format(name, stats[name + "_errors"]))
+            errors += 1
+    if stats["violations"]:
+        print("  {:d} FT601 protocol violations".format(stats["violations"]))
+        errors += 1
+    return errors, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FT601Sync simulation test (data integrity under randomized backpressure)")
+    parser.add_argument("--scenario", default="all", choices=list(scenarios.keys()) + ["all"])
+    parser.add_argument("--words",    default=1000, type=int, help="words sent in each direction")
+    parser.add_argument("--seeds",    default=1,    type=int, help="number of random seeds per scenario")
+    args = parser.parse_args()
+
+    failures = 0
+    for scenario in scenarios.keys():
+        if args.scenario not in [scenario, "all"]:
+            continue
+        for seed in range(args.seeds):
+            errors, stats = run_scenario(scenario, args.words, seed)
+            print("{:13s} seed {:d}: {} in {:d} cycles ({:.3f} words/cycle)".format(
+                scenario, seed,
+                "PASS" if not errors else "FAIL",
+                stats["cycles"], 2*args.words/stats["cycles"]))
+            failures += errors != 0
+    sys.exit(failures != 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import time
+
+from litex import RemoteClient
+
+wb = RemoteClient()
+wb.open()
+
+# # #
+
+# answer MRds to 0x40000000-0x40003fff from the responder window (filled with a pattern).
+responder_base = wb.mems.tlp_responder.base
+for i in range(16*1024//4):
+    wb.write(responder_base + 4*i, i)
+wb.regs.tlp_responder_base.write(0x40000000)
+wb.regs.tlp_responder_enable.write(1)
+
+for i in range(10):
+    print("hits: {:d} misses: {:d}".format(
+        wb.regs.tlp_responder_hits.read(),
+        wb.regs.tlp_responder_misses.read()))
+    time.sleep(1)
+
+wb.regs.tlp_responder_enable.write(0)
+
+# # #
+
+wb.close()
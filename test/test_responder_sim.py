@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import random
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from migen import *
+
+from gateware.responder import TLPResponder
+
+from tlp_model import mem_rd32, mem_wr32, send_tlps, receive_tlps, run_scenarios
+
+completer_id = 0x0100
+base         = 0x40000000
+size         = 1024
+max_length   = 32
+
+# Scenarios ----------------------------------------------------------------------------------------
+
+# name: requests (TLP, answered).
+scenarios = {
+    # MRds with partial first/last byte enables.
+    "byte-enables": [
+        (mem_rd32(base + 0x010), True),
+        (mem_rd32(base + 0x014, first_be=0b0110), True),
+        (mem_rd32(base + 0x018, first_be=0b1000), True),
+        (mem_rd32(base + 0x01c, first_be=0b0000), True),
+        (mem_rd32(base + 0x020, first_be=0b1001), True),
+        (mem_rd32(base + 0x07c, length=4, first_be=0b1110, last_be=0b0011), True),
+        (mem_rd32(base + 0x100, length=3, first_be=0b1100, last_be=0b0001), True),
+        (mem_rd32(base + 0x104, length=2, first_be=0b1111, last_be=0b0111), True),
+        (mem_rd32(base + 0x200, length=max_length), True),
+        (mem_rd32(base + 0x200, length=max_length + 1), False),
+    ],
+    # MRds at the edges of the window, other TLPs.
+    "window-edges": [
+        (mem_rd32(base), True),
+        (mem_rd32(base + size - 4), True),
+        (mem_rd32(base + size - 8, length=2), True),
+        (mem_rd32(base + size - 4, length=2), False),
+        (mem_rd32(base + size), False),
+        (mem_rd32(base - 4), False),
+        (mem_rd32(base - 4, length=2), False),
+        (mem_wr32(base + 0x010, [0x12345678]), False),
+    ],
+}
+
+# Model --------------------------------------------------------------------------------------------
+
+def lead(be):
+    # bytes before the first enabled byte.
+    for i in range(4):
+        if be & (1 << i):
+            return i
+    return 0
+
+
+def trail(be):
+    # bytes after the last enabled byte.
+    for i in reversed(range(4)):
+        if be & (1 << i):
+            return 3 - i
+    return 0
+
+
+def completion(request, memory):
+    dw0, dw1, address = request
+    length   = dw0 & 0x3ff
+    first_be = dw1 & 0xf
+    last_be  = (dw1 >> 4) & 0xf
+    if length == 1:
+        byte_count = 1 if first_be == 0 else 4 - lead(first_be) - trail(first_be)
+    else:
+        byte_count = 4*length - lead(first_be) - trail(last_be)
+    lower_address = (address & 0x7c) | lead(first_be)
+    word = (address - base)//4
+    return [
+        (0b10 << 29) | (0b01010 << 24) | (dw0 & 0x00703000) | length,
+        (completer_id << 16) | byte_count,
+        (dw1 & 0xffffff00) | lower_address,
+    ] + memory[word:word + length]
+
+# Test ---------------------------------------------------------------------------------------------
+
+def run_scenario(scenario, seed, rate):
+    rng = random.Random(seed)
+    requests = scenarios[scenario]
+    dut = TLPResponder(completer_id, size=size, max_length=max_length)
+    memory = [rng.getrandbits(32) for i in range(size//4)]
+    forwarded = []
+    completions = []
+    status = {}
+    def generator():
+        for i, data in enumerate(memory):
+            yield from dut.bus.write(i, data)
+        yield dut.base.storage.eq(base)
+        yield dut.enable.storage.eq(1)
+        yield
+        yield from send_tlps(dut.sink, [tlp for tlp, answered in requests], rng, rate)
+        for i in range(4*max_length):
+            yield
+        status["hits"] = (yield dut.hits.status)
+        status["misses"] = (yield dut.misses.status)
+    run_simulation(dut, [
+        generator(),
+        receive_tlps(dut.source, forwarded, rng, rate),
+        receive_tlps(dut.cpl_source, completions, rng, rate),
+    ])
+    errors = 0
+    for name, received, expected in [
+        ("completions", completions, [completion(tlp, memory) for tlp, answered in requests if answered]),
+        ("forwarded",   forwarded,   [tlp for tlp, answered in requests if not answered])]:
+        if received != expected:
+            print("  {}: {:d}/{:d} TLPs, {:d} differ".format(name, len(received), len(expected),
+                sum(a != b for a, b in zip(received, expected))))
+            errors += 1
+    hits   = sum(answered for tlp, answered in requests)
+    misses = sum(not answered and (tlp[0] >> 24) == 0 for tlp, answered in requests)
+    for name, value in [("hits", hits), ("misses", misses)]:
+        if status[name] != value:
+            print("  {}: {:d} (expected {:d})".format(name, status[name], value))
+            errors += 1
+    return errors
+
+
+def main():
+    run_scenarios("TLPResponder simulation test (completion headers and window edges)", scenarios, run_scenario)
+
+if __name__ == "__main__":
+    main()
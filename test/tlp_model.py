@@ -0,0 +1,94 @@
+import sys
+import argparse
+
+from migen import *
+from migen.sim import passive
+
+# TLPs ---------------------------------------------------------------------------------------------
+
+# TLPs are lists of dwords (3 dwords headers).
+
+def mem_rd32(address, length=1, requester_id=0x0100, tag=0, first_be=0xf, last_be=None):
+    if last_be is None:
+        last_be = 0x0 if length == 1 else 0xf
+    return [
+        (0b00 << 29) | (0b00000 << 24) | length,
+        (requester_id << 16) | (tag << 8) | (last_be << 4) | first_be,
+        address,
+    ]
+
+
+def mem_wr32(address, data, requester_id=0x0100, tag=0):
+    return [
+        (0b10 << 29) | (0b00000 << 24) | len(data),
+        (requester_id << 16) | (tag << 8) | ((0x0 if len(data) == 1 else 0xf) << 4) | 0xf,
+        address,
+    ] + data
+
+
+def tlp_beats(dwords):
+    # 64-bit beats (dat, be, last) of a TLP.
+    beats = []
+    for i in range(0, len(dwords), 2):
+        if i + 1 < len(dwords):
+            beats.append((dwords[i] | (dwords[i + 1] << 32), 0xff, i + 2 == len(dwords)))
+        else:
+            beats.append((dwords[i], 0x0f, 1))
+    return beats
+
+# Generators ---------------------------------------------------------------------------------------
+
+def send_tlps(sink, tlps, rng, rate=1.0):
+    # TLPs from the PCIe core, a beat is presented on a cycle with probability rate.
+    for tlp in tlps:
+        for dat, be, last in tlp_beats(tlp):
+            while rng.random() >= rate:
+                yield sink.valid.eq(0)
+                yield
+            yield sink.valid.eq(1)
+            yield sink.dat.eq(dat)
+            yield sink.be.eq(be)
+            yield sink.last.eq(last)
+            yield
+            while not (yield sink.ready):
+                yield
+    yield sink.valid.eq(0)
+
+
+@passive
+def receive_tlps(source, tlps, rng, rate=1.0):
+    # TLPs (lists of dwords) from source are appended to tlps, a beat is accepted on a cycle with
+    # probability rate.
+    dwords = []
+    while True:
+        yield source.ready.eq(rng.random() < rate)
+        yield
+        if (yield source.valid) and (yield source.ready):
+            dat = (yield source.dat)
+            dwords.append(dat & 0xffffffff)
+            if (yield source.be) & 0xf0:
+                dwords.append(dat >> 32)
+            if (yield source.last):
+                tlps.append(dwords)
+                dwords = []
+
+# Runner -------------------------------------------------------------------------------------------
+
+def run_scenarios(description, scenarios, run_scenario, seeds=4, rate=0.7):
+    # Command line of the TLP simulation tests: run_scenario(scenario, seed, rate) returns the
+    # number of errors of a scenario, the exit status is non-zero on failures.
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--scenario", default="all", choices=list(scenarios) + ["all"])
+    parser.add_argument("--seeds",    default=seeds, type=int,   help="number of random seeds per scenario")
+    parser.add_argument("--rate",     default=rate,  type=float, help="probability a beat is transferred per cycle")
+    args = parser.parse_args()
+
+    failures = 0
+    for scenario in scenarios:
+        if args.scenario not in [scenario, "all"]:
+            continue
+        for seed in range(args.seeds):
+            errors = run_scenario(scenario, seed, args.rate)
+            print("{:12s} seed {:d}: {}".format(scenario, seed, "PASS" if not errors else "FAIL"))
+            failures += errors != 0
+    sys.exit(failures != 0)